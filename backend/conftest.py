@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The backend modules are scripts that import each other by name, so make both folders importable
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "yolo_detection"))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "gemini_files"))
+
+# An interactive camera script, not a test
+collect_ignore = [os.path.join("gemini_files", "gemini_test.py")]
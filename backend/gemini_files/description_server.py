@@ -0,0 +1,180 @@
+import asyncio
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+import socketio
+from aiohttp import web
+from dotenv import load_dotenv
+
+from description_service import DescriptionService
+
+# Load environment variables
+load_dotenv()
+
+sio = socketio.AsyncServer(cors_allowed_origins='*', async_mode='aiohttp')
+app = web.Application()
+sio.attach(app)
+
+service = DescriptionService()
+
+
+def decode_image(buffer):
+    """Decode an encoded image from a bytes-like buffer, or None"""
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if data.size == 0:
+        return None
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+def sentence_stream(image, objects, detections, frame_width, timings):
+    """The service's sentence generator: detection-grounded when detections were sent"""
+    if detections is not None:
+        return service.describe_detections_stream(detections, image, frame_width, timings=timings)
+    if image is None:
+        raise ValueError("Send an image, detections or both")
+    return service.describe_stream(image, objects, timings=timings)
+
+
+async def stream_sentences(image, objects, timings, detections=None, frame_width=None):
+    """
+    Run the blocking describe_stream generator in a thread and yield its
+    sentences on the event loop as soon as each one is complete.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+    cancelled = threading.Event()
+
+    def produce():
+        try:
+            sentences = sentence_stream(image, objects, detections, frame_width, timings)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+            return
+
+        try:
+            for sentence in sentences:
+                if cancelled.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, sentence)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            sentences.close()
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # The client went away; stop asking the model for more
+        cancelled.set()
+        await producer
+
+
+def timing_summary(timings):
+    return {
+        "cached": timings.get("cached", False),
+        "first_sentence_ms": round(timings["first_sentence"] * 1000, 1) if "first_sentence" in timings else None,
+        "total_ms": round(timings["total"] * 1000, 1) if "total" in timings else None,
+    }
+
+
+async def describe(request):
+    """
+    POST an image (multipart field "image" or a raw image/* body) and get
+    the description back as newline-delimited JSON, one line per sentence
+    as it is generated, then a final line with timings.
+
+    With a "detections" field (the JSON list from detection-results) and
+    "width", the prompt is built from the detections and the image is only
+    sent to the model when they are ambiguous; the image is then optional.
+    """
+    objects = request.query.get("objects", "")
+    detections, frame_width = None, None
+    if request.content_type.startswith("multipart/"):
+        form = await request.post()
+        upload = form.get("image")
+        buffer = upload.file.read() if upload is not None else b""
+        objects = form.get("objects", objects)
+        try:
+            if "detections" in form:
+                detections = json.loads(form["detections"])
+            if "width" in form:
+                frame_width = int(form["width"])
+        except ValueError:
+            return web.json_response({"message": "Invalid detections or width"}, status=400)
+    else:
+        buffer = await request.read()
+
+    image = decode_image(buffer)
+    if image is None and (buffer or detections is None):
+        return web.json_response({"message": "Image could not be decoded"}, status=400)
+    objects = [label for label in objects.split(",") if label]
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+
+    timings = {}
+    try:
+        index = 0
+        async for sentence in stream_sentences(image, objects, timings, detections, frame_width):
+            await response.write(json.dumps({"index": index, "text": sentence}).encode() + b"\n")
+            index += 1
+        await response.write(json.dumps({"done": True, **timing_summary(timings)}).encode() + b"\n")
+    except Exception as e:
+        print(f"Error describing image: {e}")
+        await response.write(json.dumps({"error": "Failed to describe image"}).encode() + b"\n")
+
+    await response.write_eof()
+    return response
+
+app.router.add_post("/describe", describe)
+
+async def stats(request):
+    return web.json_response(service.stats())
+
+app.router.add_get("/stats", stats)
+
+@sio.event
+async def describe_scene(sid, data):
+    """
+    data: {"request_id": ..., "image": <encoded image bytes>, "objects": [labels]},
+    or {"request_id", "detections", "width"} with an optional image for a
+    detection-grounded description. Emits "description-sentence" for each
+    sentence, then "description-done".
+    """
+    request_id = data.get("request_id")
+    detections = data.get("detections")
+    image = decode_image(data.get("image") or b"")
+    if image is None and (data.get("image") or detections is None):
+        await sio.emit("error", {"message": "Image could not be decoded", "request_id": request_id}, room=sid)
+        return
+
+    timings = {}
+    try:
+        index = 0
+        async for sentence in stream_sentences(image, data.get("objects") or [], timings,
+                                               detections, data.get("width")):
+            await sio.emit("description-sentence", {"request_id": request_id, "index": index, "text": sentence}, room=sid)
+            index += 1
+        await sio.emit("description-done", {"request_id": request_id, **timing_summary(timings)}, room=sid)
+    except Exception as e:
+        print(f"Error describing image: {e}")
+        await sio.emit("error", {"message": "Failed to describe image", "request_id": request_id}, room=sid)
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("DESCRIPTION_PORT", 5001))
+    web.run_app(app, host='0.0.0.0', port=port)
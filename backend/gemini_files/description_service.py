@@ -0,0 +1,341 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+from prompt_builder import build_prompt, compress_image
+
+# Which model answers description requests: "gemini" or "stub" (local, for tests)
+DESCRIPTION_CLIENT = os.environ.get("DESCRIPTION_CLIENT", "gemini")
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-1.5-flash")
+DESCRIPTION_PROMPT = "Describe the main object in this image and its approximate size."
+# Cached descriptions: how many, and for how long (seconds)
+DESCRIPTION_CACHE_SIZE = int(os.environ.get("DESCRIPTION_CACHE_SIZE", 256))
+DESCRIPTION_CACHE_TTL = float(os.environ.get("DESCRIPTION_CACHE_TTL", 60))
+# Images whose 64-bit hashes differ in at most this many bits count as the same scene
+HASH_MAX_DISTANCE = int(os.environ.get("DESCRIPTION_HASH_MAX_DISTANCE", 6))
+
+
+def perceptual_hash(image):
+    """64-bit difference hash of a BGR image; similar scenes get similar hashes"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hash_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class DescriptionClient:
+    """Interface for the model behind the description service"""
+
+    name = "base"
+
+    def generate(self, prompt, image=None):
+        """Return the model's text for a prompt and an optional BGR image or JPEG bytes"""
+        raise NotImplementedError
+
+    def stream(self, prompt, image=None):
+        """Yield the model's text in chunks as it is generated"""
+        yield self.generate(prompt, image)
+
+
+class GeminiClient(DescriptionClient):
+    """Google Gemini through google-generativeai"""
+
+    name = "gemini"
+
+    def __init__(self, model_name=GEMINI_MODEL, api_key=None):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key or os.getenv("GOOGLE_API_KEY"))
+        self.model = genai.GenerativeModel(model_name)
+
+    @staticmethod
+    def _parts(prompt, image):
+        from PIL import Image
+
+        parts = [prompt]
+        if isinstance(image, bytes):
+            parts.append({"mime_type": "image/jpeg", "data": image})
+        elif image is not None:
+            parts.append(Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)))
+        return parts
+
+    def generate(self, prompt, image=None):
+        return self.model.generate_content(self._parts(prompt, image)).text
+
+    def stream(self, prompt, image=None):
+        for chunk in self.model.generate_content(self._parts(prompt, image), stream=True):
+            yield chunk.text
+
+
+class StubClient(DescriptionClient):
+    """
+    Local stand-in for Gemini: a canned answer after a fake network delay,
+    streamed a few words at a time like a real model would.
+    """
+
+    name = "stub"
+
+    def __init__(self, text="A stub description of the scene. A person is standing ahead. The path is clear.",
+                 delay=0.5, chunk_delay=0.15, chunk_words=3):
+        self.text = text
+        self.delay = delay
+        self.chunk_delay = chunk_delay
+        self.chunk_words = chunk_words
+        self.calls = 0
+
+    def generate(self, prompt, image=None):
+        return "".join(self.stream(prompt, image))
+
+    def stream(self, prompt, image=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        words = self.text.split(" ")
+        for i in range(0, len(words), self.chunk_words):
+            if i:
+                time.sleep(self.chunk_delay)
+            yield " ".join(words[i:i + self.chunk_words]) + (" " if i + self.chunk_words < len(words) else "")
+
+
+def make_client(kind=DESCRIPTION_CLIENT, model_name=GEMINI_MODEL):
+    if kind == "gemini":
+        return GeminiClient(model_name)
+    if kind == "stub":
+        return StubClient()
+    raise ValueError(f"Unknown description client: {kind}")
+
+
+class SentenceSplitter:
+    """Turns streamed text chunks into complete sentences"""
+
+    # End of sentence: . ! or ? (and any closing quotes/brackets) followed by whitespace
+    SENTENCE_END = re.compile(r"(?<=[.!?])\s+|(?<=[.!?][\"')\]])\s+")
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, chunk):
+        """Add a chunk and return the sentences it completed"""
+        self.buffer += chunk
+        parts = self.SENTENCE_END.split(self.buffer)
+        self.buffer = parts.pop()
+        return [part.strip() for part in parts if part.strip()]
+
+    def flush(self):
+        """The rest of the text once the stream has ended"""
+        rest, self.buffer = self.buffer.strip(), ""
+        return [rest] if rest else []
+
+
+def split_sentences(text):
+    splitter = SentenceSplitter()
+    return splitter.feed(text) + splitter.flush()
+
+
+class DescriptionService:
+    """
+    Scene descriptions with a bounded LRU/TTL cache in front of the model.
+    Entries are keyed by a perceptual hash of the image plus the set of
+    detected objects, so repeat captures of the same scene are answered
+    from memory, and concurrent requests for the same scene share one
+    upstream call. Safe to call from several threads.
+    """
+
+    def __init__(self, client=None, cache_size=DESCRIPTION_CACHE_SIZE, ttl=DESCRIPTION_CACHE_TTL,
+                 max_distance=HASH_MAX_DISTANCE):
+        self.client = client if client is not None else make_client()
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.max_distance = max_distance
+        # (image hash, objects, prompt) -> (created_at, text), least recently used first
+        self._cache = OrderedDict()
+        # (image hash, objects, prompt) -> Future for requests being answered right now
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        # Detection-grounded requests sent with and without an image
+        self.images_attached = 0
+        self.text_only = 0
+        # Streamed descriptions: count and summed time to first sentence / complete text
+        self.streams = 0
+        self.first_sentence_seconds = 0.0
+        self.total_seconds = 0.0
+
+    def _find(self, entries, image_hash, objects, prompt):
+        """Key of an entry for the same objects and prompt with a close enough image, or None"""
+        key = (image_hash, objects, prompt)
+        if key in entries:
+            return key
+        for other in entries:
+            if other[1:] == key[1:] and hash_distance(other[0], image_hash) <= self.max_distance:
+                return other
+        return None
+
+    def _lookup(self, image, objects, prompt, image_hash=None):
+        """
+        Returns (key, cached text, future, owner). owner is True when the
+        caller must ask the model and resolve future; otherwise it can wait
+        on future, unless the text was cached.
+        """
+        if image_hash is None:
+            # Text-only requests are keyed by their prompt alone
+            image_hash = perceptual_hash(image) if isinstance(image, np.ndarray) else 0
+        objects = frozenset(objects)
+        now = time.time()
+
+        with self._lock:
+            key = self._find(self._cache, image_hash, objects, prompt)
+            if key is not None:
+                created_at, text = self._cache[key]
+                if now - created_at <= self.ttl:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return key, text, None, False
+                del self._cache[key]
+
+            key = self._find(self._in_flight, image_hash, objects, prompt)
+            if key is not None:
+                self.coalesced += 1
+                return key, None, self._in_flight[key], False
+
+            key = (image_hash, objects, prompt)
+            future = self._in_flight[key] = Future()
+            self.misses += 1
+            return key, None, future, True
+
+    def _store(self, key, future, text):
+        future.set_result(text)
+        with self._lock:
+            self._cache[key] = (time.time(), text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _release(self, key, future):
+        if not future.done():
+            future.set_exception(RuntimeError("Description request was abandoned"))
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def describe(self, image, objects=(), prompt=DESCRIPTION_PROMPT, image_hash=None):
+        """
+        Describe a BGR image. objects are the labels detected in it; the
+        same scene with different objects is described again. image may
+        also be JPEG bytes, with image_hash taken from the original frame,
+        or None for a text-only prompt.
+        """
+        key, text, future, owner = self._lookup(image, objects, prompt, image_hash)
+        if text is not None:
+            return text
+        if not owner:
+            return future.result()
+
+        try:
+            text = self.client.generate(prompt, image)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            self._store(key, future, text)
+            return text
+        finally:
+            self._release(key, future)
+
+    def describe_stream(self, image, objects=(), prompt=DESCRIPTION_PROMPT, timings=None, image_hash=None):
+        """
+        Like describe(), but yields the description one sentence at a time
+        as the model generates it, so speech can start on the first one.
+        timings, if given, gets "first_sentence" and "total" in seconds.
+        """
+        if timings is None:
+            timings = {}
+        start_time = time.perf_counter()
+
+        def sentence_ready():
+            if "first_sentence" not in timings:
+                timings["first_sentence"] = time.perf_counter() - start_time
+
+        key, text, future, owner = self._lookup(image, objects, prompt, image_hash)
+        if text is not None or not owner:
+            # Cached, or another request is generating it: no partial text to stream
+            timings["cached"] = text is not None
+            for sentence in split_sentences(text if text is not None else future.result()):
+                sentence_ready()
+                yield sentence
+        else:
+            timings["cached"] = False
+            try:
+                chunks = []
+                splitter = SentenceSplitter()
+                for chunk in self.client.stream(prompt, image):
+                    chunks.append(chunk)
+                    for sentence in splitter.feed(chunk):
+                        sentence_ready()
+                        yield sentence
+                for sentence in splitter.flush():
+                    sentence_ready()
+                    yield sentence
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            else:
+                self._store(key, future, "".join(chunks))
+            finally:
+                self._release(key, future)
+
+        timings["total"] = time.perf_counter() - start_time
+        with self._lock:
+            self.streams += 1
+            self.first_sentence_seconds += timings.get("first_sentence", timings["total"])
+            self.total_seconds += timings["total"]
+
+    def grounded_request(self, detections, image=None, frame_width=None):
+        """
+        Arguments for describe()/describe_stream() from YOLO detections:
+        a compact text prompt, plus a small JPEG of the frame only when the
+        detections are ambiguous.
+        """
+        if image is not None:
+            frame_width = image.shape[1]
+        prompt, reason = build_prompt(detections, frame_width, with_image=image is not None)
+        objects = [obj["label"] for obj in detections]
+
+        if reason and image is not None:
+            self.images_attached += 1
+            return {"image": compress_image(image), "objects": objects, "prompt": prompt,
+                    "image_hash": perceptual_hash(image)}
+        self.text_only += 1
+        return {"image": None, "objects": objects, "prompt": prompt}
+
+    def describe_detections(self, detections, image=None, frame_width=None):
+        """Describe a scene from its detections, with an image only if they are ambiguous"""
+        return self.describe(**self.grounded_request(detections, image, frame_width))
+
+    def describe_detections_stream(self, detections, image=None, frame_width=None, timings=None):
+        return self.describe_stream(timings=timings, **self.grounded_request(detections, image, frame_width))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "client": self.client.name,
+                "cached": len(self._cache),
+                "in_flight": len(self._in_flight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "images_attached": self.images_attached,
+                "text_only": self.text_only,
+                "streams": self.streams,
+                "avg_first_sentence_ms": self.first_sentence_seconds / self.streams * 1000 if self.streams else None,
+                "avg_total_ms": self.total_seconds / self.streams * 1000 if self.streams else None,
+            }
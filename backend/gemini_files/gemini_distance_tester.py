@@ -1,28 +1,37 @@
 import os
+import sys
 import cv2
 import numpy as np
-import google.generativeai as genai
 from dotenv import load_dotenv
-from PIL import Image
-import io
+
+from description_service import DescriptionService, make_client
+
+# Camera intrinsics come from the calibration profiles in ../yolo_detection
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "yolo_detection"))
+from distance_estimation import DEFAULT_PROFILE, load_profile  # noqa: E402
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-model = genai.GenerativeModel("gemini-2.0-pro-exp-02-05")
+# Descriptions go through the caching service; DESCRIPTION_CLIENT=stub runs without Gemini
+service = DescriptionService(make_client(model_name="gemini-2.0-pro-exp-02-05"))
 
-# Camera parameters (calibrate these for your camera)
-FOCAL_LENGTH = 800  # Pixels (example value - calibrate for your camera)
+# Camera parameters: CAMERA_PROFILE names a profile made with calibrate_camera.py
+profile = load_profile(os.getenv("CAMERA_PROFILE", "default"))
+# Focal length used without a profile file, as before profiles existed (pixels)
+FALLBACK_FOCAL_LENGTH = 800
 KNOWN_WIDTHS = {  # Real-world widths in centimeters
     "pumpkin": 30,  # Example width, change to actual known object width
 }
 
 
-def calculate_distance(pixel_width, real_width):
+def calculate_distance(pixel_width, real_width, image):
     """Calculate distance using perspective projection formula"""
-    return (real_width * FOCAL_LENGTH) / pixel_width
+    if profile is DEFAULT_PROFILE:
+        focal_length = FALLBACK_FOCAL_LENGTH
+    else:
+        focal_length = profile.intrinsics(image.shape[1], image.shape[0])[0]
+    return (real_width * focal_length) / pixel_width
 
 
 def get_pixel_width(image):
@@ -54,16 +63,11 @@ def main():
         print("Failed to capture image")
         return
 
-    # Convert numpy ndarray to PIL Image for Gemini
-    image_pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-
-    # Get object detection from Gemini
-    response = model.generate_content(
-        ["Describe the main object in this image and its approximate size.", image_pil]
-    )
+    # Get object detection from Gemini (or the cache, for a scene seen recently)
+    response_text = service.describe(image)
 
     # Parse Gemini response for object names and distances (optional)
-    response_text = response.text.lower()
+    response_text = response_text.lower()
     print("Gemini Response:", response_text)  # See how Gemini responds
 
     detected_objects = []
@@ -82,7 +86,7 @@ def main():
             detected_object = detected_objects[i]
             pixel_width = w
             real_width = KNOWN_WIDTHS[detected_object]
-            distance = calculate_distance(pixel_width, real_width)
+            distance = calculate_distance(pixel_width, real_width, image)
 
             print(f"Detected {detected_object} ({real_width}cm wide)")
             print(f"Bounding Box: {x}, {y}, {w}, {h}")
@@ -0,0 +1,107 @@
+import os
+
+import cv2
+
+# Attach an image when a detection is less certain than this
+AMBIGUOUS_CONFIDENCE = float(os.environ.get("PROMPT_AMBIGUOUS_CONFIDENCE", 0.5))
+# Boxes of different classes overlapping this much (IoU) may be the same object
+AMBIGUOUS_OVERLAP = 0.5
+# Most objects listed in a prompt, nearest first
+MAX_PROMPT_OBJECTS = int(os.environ.get("PROMPT_MAX_OBJECTS", 8))
+# Attached images are downscaled to this longest side and JPEG-compressed
+PROMPT_IMAGE_MAX_SIDE = int(os.environ.get("PROMPT_IMAGE_MAX_SIDE", 384))
+PROMPT_JPEG_QUALITY = int(os.environ.get("PROMPT_JPEG_QUALITY", 60))
+# Distances are rounded to this many meters so small changes still hit the cache
+DISTANCE_STEP_M = 0.5
+
+INSTRUCTIONS = (
+    "You are describing the surroundings to a blind person. "
+    "In two or three short sentences, say what is ahead and where, nearest and most important first. "
+    "Use the detected objects below; positions are from the camera's point of view."
+)
+IMAGE_INSTRUCTIONS = " Some detections are uncertain; use the attached image to confirm or correct them."
+
+
+def position(bbox, frame_width):
+    """left, ahead or right from the box center"""
+    center = (bbox[0] + bbox[2]) / 2 / frame_width
+    if center < 1 / 3:
+        return "left"
+    if center > 2 / 3:
+        return "right"
+    return "ahead"
+
+
+def overlap(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def ambiguity(detections):
+    """Why the detections alone can't describe the scene, or None if they can"""
+    if not detections:
+        return "nothing detected"
+    for obj in detections:
+        if obj.get("confidence", 1.0) < AMBIGUOUS_CONFIDENCE:
+            return f"uncertain {obj['label']}"
+
+    boxed = [obj for obj in detections if obj.get("bbox")]
+    for i, a in enumerate(boxed):
+        for b in boxed[i + 1:]:
+            if a["label"] != b["label"] and overlap(a["bbox"], b["bbox"]) > AMBIGUOUS_OVERLAP:
+                return f"{a['label']} overlaps {b['label']}"
+    return None
+
+
+def describe_object(obj, frame_width):
+    parts = [obj["label"]]
+    if obj.get("bbox") and frame_width:
+        parts.append(position(obj["bbox"], frame_width))
+    distance = obj.get("distance")
+    if distance is not None:
+        parts.append(f"{round(distance / DISTANCE_STEP_M) * DISTANCE_STEP_M:.1f} m")
+    else:
+        parts.append("distance unknown")
+    return ", ".join(parts)
+
+
+def build_prompt(detections, frame_width=None, with_image=False):
+    """
+    Compact text prompt from YOLO detections and their distances; left /
+    ahead / right positions need the frame width. Returns
+    (prompt, reason) where reason says why an image should be attached, or
+    None when the text alone is enough. The prompt only refers to an
+    attached image when with_image is set, i.e. one is available to attach.
+    """
+    # Nearest first; objects without a distance go last
+    ordered = sorted(detections, key=lambda obj: obj["distance"] if obj.get("distance") is not None else float("inf"))
+    listed = ordered[:MAX_PROMPT_OBJECTS]
+
+    lines = [INSTRUCTIONS]
+    reason = ambiguity(listed)
+    if reason and with_image:
+        lines[0] += IMAGE_INSTRUCTIONS
+    lines.append("Detected objects:")
+    if listed:
+        lines.extend(f"- {describe_object(obj, frame_width)}" for obj in listed)
+    else:
+        lines.append("- none")
+    if len(ordered) > len(listed):
+        lines.append(f"- and {len(ordered) - len(listed)} more further away")
+
+    return "\n".join(lines), reason
+
+
+def compress_image(image, max_side=PROMPT_IMAGE_MAX_SIDE, quality=PROMPT_JPEG_QUALITY):
+    """Downscale a BGR image and encode it as JPEG bytes"""
+    height, width = image.shape[:2]
+    scale = min(1.0, max_side / max(width, height))
+    if scale < 1.0:
+        image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Image could not be encoded")
+    return encoded.tobytes()
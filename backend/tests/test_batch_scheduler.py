@@ -0,0 +1,166 @@
+import asyncio
+
+import pytest
+
+from batch_scheduler import BatchScheduler
+
+
+class FakeExecutor:
+    """Runs "inference" on the event loop: every frame's detections are just the frame itself"""
+
+    def __init__(self, max_pending=1):
+        self.max_pending = max_pending
+        self.batches = []
+        # Cleared to hold batches until the test lets them finish
+        self.proceed = asyncio.Event()
+        self.proceed.set()
+
+    async def run(self, fn, imgs, imgsz=None, profiles=None):
+        self.batches.append((list(imgs), imgsz))
+        await self.proceed.wait()
+        return list(imgs), {}
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 5))
+
+
+async def started(executor, **kwargs):
+    scheduler = BatchScheduler(executor, max_wait_ms=0, **kwargs)
+    scheduler.start()
+    return scheduler
+
+
+def test_sessions_share_a_batch():
+    async def main():
+        executor = FakeExecutor()
+        scheduler = BatchScheduler(executor, max_wait_ms=0)
+        futures = [scheduler.submit(sid, f"frame {sid}") for sid in ("a", "b", "c")]
+        scheduler.start()
+        try:
+            assert await asyncio.gather(*futures) == ["frame a", "frame b", "frame c"]
+        finally:
+            await scheduler.stop()
+        assert executor.batches == [(["frame a", "frame b", "frame c"], None)]
+        assert scheduler.stats()["avg_batch_size"] == 3
+
+    run(main())
+
+
+def test_newer_frame_replaces_waiting_one():
+    async def main():
+        executor = FakeExecutor()
+        scheduler = BatchScheduler(executor, max_wait_ms=0)
+        old = scheduler.submit("a", "frame 1")
+        new = scheduler.submit("a", "frame 2")
+        assert old.cancelled()
+        assert scheduler.frames_replaced == 1
+
+        scheduler.start()
+        try:
+            assert await new == "frame 2"
+        finally:
+            await scheduler.stop()
+        assert executor.batches == [(["frame 2"], None)]
+
+    run(main())
+
+
+def test_parts_have_their_own_slots():
+    async def main():
+        executor = FakeExecutor()
+        scheduler = BatchScheduler(executor, max_wait_ms=0)
+        frame = scheduler.submit("a", "frame")
+        tile = scheduler.submit("a", "tile", part="roi0")
+        other = scheduler.submit("b", "other")
+        assert not frame.cancelled() and not tile.cancelled()
+
+        scheduler.discard("a")
+        assert frame.cancelled() and tile.cancelled()
+        assert list(scheduler.pending) == ["b"]
+
+        scheduler.start()
+        try:
+            assert await other == "other"
+        finally:
+            await scheduler.stop()
+
+    run(main())
+
+
+def test_frames_are_batched_by_input_size():
+    async def main():
+        executor = FakeExecutor()
+        scheduler = BatchScheduler(executor, max_wait_ms=0)
+        futures = [
+            scheduler.submit("a", "a", imgsz=320),
+            scheduler.submit("b", "b", imgsz=640),
+            scheduler.submit("c", "c", imgsz=320),
+        ]
+        scheduler.start()
+        try:
+            assert await asyncio.gather(*futures) == ["a", "b", "c"]
+        finally:
+            await scheduler.stop()
+        assert executor.batches == [(["a", "c"], 320), (["b"], 640)]
+
+    run(main())
+
+
+def test_higher_priority_goes_first():
+    async def main():
+        executor = FakeExecutor()
+        scheduler = BatchScheduler(executor, max_batch_size=1, max_wait_ms=0)
+        futures = [scheduler.submit("calm", "calm"), scheduler.submit("hazard", "hazard", priority=5.0)]
+        scheduler.start()
+        try:
+            await asyncio.gather(*futures)
+        finally:
+            await scheduler.stop()
+        assert [imgs for imgs, _ in executor.batches] == [["hazard"], ["calm"]]
+
+    run(main())
+
+
+def test_session_is_never_in_two_batches():
+    async def main():
+        executor = FakeExecutor(max_pending=2)
+        executor.proceed.clear()
+        scheduler = await started(executor)
+        try:
+            first = scheduler.submit("a", "frame 1")
+            while not executor.batches:
+                await asyncio.sleep(0)
+
+            # A free worker is not enough while the session's first frame is still running
+            second = scheduler.submit("a", "frame 2")
+            await asyncio.sleep(0.05)
+            assert len(executor.batches) == 1
+            assert scheduler.stats()["in_flight_sessions"] == 1
+
+            executor.proceed.set()
+            assert await first == "frame 1"
+            assert await second == "frame 2"
+        finally:
+            await scheduler.stop()
+        assert [imgs for imgs, _ in executor.batches] == [["frame 1"], ["frame 2"]]
+
+    run(main())
+
+
+def test_failed_batch_fails_its_futures():
+    class FailingExecutor(FakeExecutor):
+        async def run(self, fn, imgs, imgsz=None, profiles=None):
+            raise RuntimeError("model crashed")
+
+    async def main():
+        scheduler = await started(FailingExecutor())
+        try:
+            with pytest.raises(RuntimeError):
+                await scheduler.submit("a", "frame")
+            # The scheduler keeps going after a failed batch
+            assert not scheduler.in_flight
+        finally:
+            await scheduler.stop()
+
+    run(main())
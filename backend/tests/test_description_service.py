@@ -0,0 +1,171 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("cv2")
+
+import description_service  # noqa: E402
+from description_service import DescriptionService, SentenceSplitter, StubClient  # noqa: E402
+from prompt_builder import IMAGE_INSTRUCTIONS  # noqa: E402
+
+
+class BlockingClient(StubClient):
+    """Stub that holds every request until released, to have two requests in flight at once"""
+
+    def __init__(self):
+        super().__init__(delay=0, chunk_delay=0)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def generate(self, prompt, image=None):
+        self.started.set()
+        assert self.release.wait(5)
+        return super().generate(prompt, image)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def client():
+    return StubClient(delay=0, chunk_delay=0)
+
+
+def test_repeat_request_is_a_cache_hit(client):
+    service = DescriptionService(client)
+
+    first = service.describe(None, ["person"], prompt="what is ahead")
+    second = service.describe(None, ["person"], prompt="what is ahead")
+
+    assert first == second == client.text
+    assert client.calls == 1
+    assert (service.hits, service.misses) == (1, 1)
+
+
+def test_different_objects_or_prompt_miss(client):
+    service = DescriptionService(client)
+
+    service.describe(None, ["person"], prompt="what is ahead")
+    service.describe(None, ["person", "chair"], prompt="what is ahead")
+    service.describe(None, ["person"], prompt="what is left")
+
+    assert client.calls == 3
+    assert service.hits == 0
+
+
+def test_close_image_hashes_share_an_entry(client):
+    service = DescriptionService(client, max_distance=2)
+
+    service.describe(b"jpeg", ["person"], image_hash=0b1111)
+    service.describe(b"jpeg", ["person"], image_hash=0b1101)
+    service.describe(b"jpeg", ["person"], image_hash=0b0000)
+
+    assert client.calls == 2
+    assert service.hits == 1
+
+
+def test_entries_expire_after_ttl(client, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(description_service.time, "time", lambda: now[0])
+    service = DescriptionService(client, ttl=60)
+
+    service.describe(None, ["person"])
+    now[0] += 59
+    service.describe(None, ["person"])
+    assert client.calls == 1
+
+    now[0] += 2
+    service.describe(None, ["person"])
+    assert client.calls == 2
+
+
+def test_least_recently_used_entry_is_evicted(client):
+    service = DescriptionService(client, cache_size=2)
+
+    service.describe(None, ["a"])
+    service.describe(None, ["b"])
+    service.describe(None, ["a"])
+    service.describe(None, ["c"])  # evicts "b"
+    service.describe(None, ["a"])
+    service.describe(None, ["b"])
+
+    assert client.calls == 4
+
+
+def test_concurrent_requests_are_coalesced():
+    client = BlockingClient()
+    service = DescriptionService(client)
+    results = []
+
+    def describe():
+        results.append(service.describe(None, ["person"]))
+
+    threads = [threading.Thread(target=describe) for _ in range(2)]
+    threads[0].start()
+    assert client.started.wait(5)
+    threads[1].start()
+    wait_until(lambda: service.coalesced == 1)
+
+    client.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [client.text, client.text]
+    assert client.calls == 1
+    assert service.stats()["in_flight"] == 0
+
+
+def test_failed_request_is_not_cached():
+    class FailingClient(StubClient):
+        def generate(self, prompt, image=None):
+            self.calls += 1
+            raise RuntimeError("upstream down")
+
+    client = FailingClient()
+    service = DescriptionService(client)
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            service.describe(None, ["person"])
+
+    assert client.calls == 2
+    assert service.stats()["cached"] == 0
+
+
+def test_stream_yields_sentences_then_serves_from_cache(client):
+    service = DescriptionService(client)
+
+    timings = {}
+    sentences = list(service.describe_stream(None, ["person"], timings=timings))
+    assert sentences == ["A stub description of the scene.", "A person is standing ahead.", "The path is clear."]
+    assert timings["cached"] is False
+
+    timings = {}
+    assert list(service.describe_stream(None, ["person"], timings=timings)) == sentences
+    assert timings["cached"] is True
+    assert client.calls == 1
+
+
+def test_sentence_splitter_joins_chunks():
+    splitter = SentenceSplitter()
+
+    assert splitter.feed("Hello wor") == []
+    assert splitter.feed("ld. How") == ["Hello world."]
+    assert splitter.feed(' are you?" Fine') == ['How are you?"']
+    assert splitter.flush() == ["Fine"]
+    assert splitter.flush() == []
+
+
+def test_text_only_request_does_not_mention_an_image(client):
+    service = DescriptionService(client)
+    # Nothing detected is ambiguous, but there is no frame to attach
+    request = service.grounded_request([], image=None, frame_width=640)
+
+    assert request["image"] is None
+    assert IMAGE_INSTRUCTIONS not in request["prompt"]
+    assert service.text_only == 1
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from distance_estimation import CameraProfile, load_profile, session_profile
+
+CALIBRATION = {"image_size": [1280, 720], "fx": 1000.0, "fy": 1000.0, "cx": 640, "cy": 360,
+               "distortion": [0.1, -0.05, 0, 0, 0]}
+
+
+def test_session_calibration_is_used():
+    profile = session_profile({"calibration": CALIBRATION})
+
+    assert profile.name == "session"
+    assert profile.calibrated
+    # Intrinsics scale with the frame
+    assert profile.intrinsics(640, 360) == (500.0, 500.0, 320.0, 180.0)
+
+
+@pytest.mark.parametrize("change", [
+    {"fx": -1000},
+    {"fy": "1000"},
+    {"fx": True},
+    {"fx": float("nan")},
+    {"image_size": [1280]},
+    {"image_size": [1280, 0]},
+    {"image_size": "1280x720"},
+    {"distortion": [0.1, 0.2, 0.3]},
+    {"distortion": [0.1, -0.05, 0, 0, "x"]},
+    {"cx": -5},
+    {"fov_deg": 200},
+    {"class_heights_cm": {"person": -170}},
+])
+def test_invalid_session_calibration_falls_back(change):
+    profile = session_profile({"calibration": {**CALIBRATION, **change}})
+
+    assert profile is load_profile()
+
+
+def test_distances_from_reference_heights():
+    profile = CameraProfile(image_size=(640, 480), fx=500.0, fy=500.0)
+    heights = np.array([170.0, np.nan])
+
+    distances = profile.distances(heights, [[0, 0, 10, 100], [0, 0, 10, 100]], 640, 480)
+
+    assert distances[0] == pytest.approx(8.5)
+    assert np.isnan(distances[1])
+
+
+def test_cropped_profile_keeps_full_frame_focal_length():
+    profile = CameraProfile(image_size=(1920, 1080), fx=1500.0, fy=1500.0)
+
+    crop = profile.cropped(400, 200, 1920, 1080)
+
+    assert crop.intrinsics(416, 416) == (1500.0, 1500.0, 960.0 - 400, 540.0 - 200)
+    assert profile.crop is None
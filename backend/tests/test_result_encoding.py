@@ -0,0 +1,128 @@
+import json
+
+import numpy as np
+import pytest
+
+from result_encoding import FLAG_NEW, OBJECT_DTYPE, UNKNOWN_DISTANCE, CompactEncoder, negotiate
+
+FIELDS = list(OBJECT_DTYPE.names)
+
+
+def payload(detections, keyframe=True):
+    return {
+        "detections": detections,
+        "fps": 5.0,
+        "captured_at": 1000.0,
+        "reused": False,
+        "keyframe": keyframe,
+        "skip_rate": 0.0,
+        "settings": {"level": 0},
+        "dropped": {"frames": 0, "results": 0},
+    }
+
+
+def obj(track_id, bbox, label="person", distance=2.0, new=False):
+    return {"track_id": track_id, "label": label, "bbox": bbox, "distance": distance,
+            "confidence": 0.9, "new": new}
+
+
+def rows(message, key):
+    return [dict(zip(FIELDS, row)) for row in message[key]]
+
+
+@pytest.fixture
+def encoder():
+    return CompactEncoder(["person", "chair"], encoding="json", keyframe_interval=100)
+
+
+def encode(encoder, detections, **kwargs):
+    return json.loads(encoder.encode(payload(detections, **kwargs)))
+
+
+def test_first_message_is_a_keyframe_with_every_object(encoder):
+    message = encode(encoder, [obj(1, [10, 20, 110, 220], new=True), obj(2, [300, 40, 360, 100], "chair", None)])
+
+    assert message["key"] is True
+    assert message["seq"] == 1
+    assert message["move"] == [] and message["remove"] == []
+    assert message["settings"] == {"level": 0}
+    person, chair = rows(message, "add")
+    assert (person["track_id"], person["class_id"], person["distance_cm"]) == (1, 0, 200)
+    assert [person[f] for f in ("x1", "y1", "x2", "y2")] == [10, 20, 110, 220]
+    assert person["flags"] == FLAG_NEW
+    assert (chair["class_id"], chair["distance_cm"]) == (1, UNKNOWN_DISTANCE)
+
+
+def test_delta_has_only_new_moved_and_removed_objects(encoder):
+    encode(encoder, [obj(1, [10, 20, 110, 220]), obj(2, [300, 40, 360, 100]), obj(3, [0, 0, 50, 50])])
+    message = encode(encoder, [obj(1, [10, 20, 110, 220]), obj(2, [320, 40, 380, 100]), obj(4, [5, 5, 60, 60])])
+
+    assert message["key"] is False
+    assert [row["track_id"] for row in rows(message, "add")] == [4]
+    assert [row["track_id"] for row in rows(message, "move")] == [2]
+    assert message["remove"] == [3]
+    # Unchanged settings are not repeated
+    assert "settings" not in message
+
+
+def test_small_moves_add_up(encoder):
+    encode(encoder, [obj(1, [100, 100, 200, 200])])
+
+    assert encode(encoder, [obj(1, [103, 100, 203, 200])])["move"] == []
+    # Compared against the row the client has, not the last one seen
+    assert len(encode(encoder, [obj(1, [106, 100, 206, 200])])["move"]) == 1
+
+
+def test_unknown_labels_are_announced_once(encoder):
+    first = encode(encoder, [obj(1, [0, 0, 10, 10], "dog")])
+    second = encode(encoder, [obj(2, [20, 0, 30, 10], "dog")])
+
+    assert first["classes"] == {"2": "dog"}
+    assert rows(first, "add")[0]["class_id"] == 2
+    assert "classes" not in second
+
+
+def test_reset_sends_a_full_keyframe(encoder):
+    encode(encoder, [obj(1, [10, 20, 110, 220]), obj(2, [300, 40, 360, 100])])
+    encode(encoder, [obj(1, [10, 20, 110, 220])])
+
+    encoder.reset()
+    message = encode(encoder, [obj(1, [10, 20, 110, 220])])
+
+    assert message["key"] is True
+    assert [row["track_id"] for row in rows(message, "add")] == [1]
+    assert message["remove"] == []
+    assert "settings" in message
+    # Back to deltas afterwards
+    assert encode(encoder, [obj(1, [10, 20, 110, 220])])["key"] is False
+
+
+def test_keyframe_interval():
+    encoder = CompactEncoder(["person"], encoding="json", keyframe_interval=3)
+    keys = [encode(encoder, [obj(1, [0, 0, 10, 10])])["key"] for _ in range(7)]
+
+    assert keys == [True, False, False, True, False, False, True]
+
+
+def test_detector_keyframes_are_flagged(encoder):
+    assert encode(encoder, [], keyframe=True)["detected"] is True
+    assert encode(encoder, [], keyframe=False)["detected"] is False
+
+
+def test_msgpack_rows_are_packed_structs():
+    msgpack = pytest.importorskip("msgpack")
+    encoder = CompactEncoder(["person"], encoding="msgpack")
+
+    message = msgpack.unpackb(encoder.encode(payload([obj(7, [1, 2, 3, 4])])), raw=False)
+
+    added = np.frombuffer(message["add"], dtype=OBJECT_DTYPE)
+    assert added.itemsize == 18
+    assert int(added[0]["track_id"]) == 7
+    assert np.frombuffer(message["remove"], dtype="<u4").size == 0
+
+
+def test_negotiate():
+    assert negotiate(None) is None
+    assert negotiate({"protocol": "json"}) is None
+    assert negotiate({"protocol": "compact", "encoding": "json"}) == "json"
+    assert negotiate({"protocol": "compact", "encoding": "xml"}) == "json"
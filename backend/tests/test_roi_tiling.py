@@ -0,0 +1,87 @@
+import numpy as np
+
+from roi_tiling import TILE_EDGE_MARGIN, choose_rois, inference_mode, merge_detections, motion_center, nms
+
+
+def det(bbox, label="person", confidence=0.9, **extra):
+    return {"label": label, "bbox": bbox, "confidence": confidence, **extra}
+
+
+def test_nms_keeps_the_most_confident_of_each_label():
+    kept = nms([
+        det([0, 0, 100, 100], confidence=0.6),
+        det([2, 2, 102, 102], confidence=0.8),
+        det([0, 0, 100, 100], "dog", confidence=0.7),
+        det([300, 300, 400, 400], confidence=0.5),
+        {"label": "wall", "confidence": 0.4},
+    ])
+
+    assert [(obj["label"], obj["confidence"]) for obj in kept] == [
+        ("person", 0.8), ("dog", 0.7), ("person", 0.5), ("wall", 0.4),
+    ]
+
+
+def test_no_tiles_when_the_frame_is_already_small():
+    assert choose_rois(640, 480, full_frame_size=640) == []
+    assert choose_rois(1920, 1080, full_frame_size=320, max_rois=0) == []
+
+
+def test_tiles_cover_small_objects_first_and_stay_in_the_frame():
+    tracked = [
+        det([1800, 40, 1830, 80], priority=1.0),
+        det([600, 500, 640, 560], priority=5.0),
+        # Too big to need a tile
+        det([100, 100, 400, 900], priority=9.0),
+    ]
+
+    rois = choose_rois(1920, 1080, 320, tracked, tile=416, max_rois=3)
+
+    assert len(rois) == 3
+    for x, y, width, height in rois:
+        assert (width, height) == (416, 416)
+        assert 0 <= x <= 1920 - width and 0 <= y <= 1080 - height
+    # Highest priority small object first, then the other one, clamped to the frame edge
+    assert rois[0] == (620 - 208, 530 - 208, 416, 416)
+    assert rois[1] == (1920 - 416, 0, 416, 416)
+
+
+def test_overlapping_candidates_are_skipped():
+    tracked = [det([900, 500, 920, 540]), det([905, 505, 925, 545])]
+
+    rois = choose_rois(1920, 1080, 320, tracked, tile=416, max_rois=3)
+
+    # The second object and the frame center fall inside the first tile
+    assert len(rois) == 1
+
+
+def test_motion_center_finds_the_moving_window():
+    change_map = np.zeros((18, 32))
+    change_map[2:6, 24:30] = 100
+
+    cx, cy = motion_center(change_map, 1920, 1080, tile=416)
+
+    assert 1400 < cx < 1800 and 100 < cy < 400
+    assert motion_center(np.zeros((18, 32)), 1920, 1080) is None
+
+
+def test_merge_offsets_tiles_and_drops_cut_off_boxes():
+    full_frame = [det([500, 300, 560, 420], confidence=0.5)]
+    tile_detections = [
+        # The same person, seen sharper in the tile
+        det([100, 100, 160, 220], confidence=0.9),
+        # Touching the tile's inner edge: only part of the object is in the tile
+        det([10, 300, 50, 416 - TILE_EDGE_MARGIN // 2], "bottle"),
+        det([200, 20, 230, 60], "cup", confidence=0.6),
+    ]
+
+    merged = merge_detections(full_frame, [(tile_detections, (400, 200, 416, 416))], 1920, 1080)
+
+    assert [(obj["label"], obj["bbox"], obj["confidence"]) for obj in merged] == [
+        ("person", [500, 300, 560, 420], 0.9),
+        ("cup", [600, 220, 630, 260], 0.6),
+    ]
+
+
+def test_inference_mode_from_auth():
+    assert inference_mode({"inference_mode": "tiled"}) == "tiled"
+    assert inference_mode({"inference_mode": "bogus"}) == inference_mode(None)
@@ -0,0 +1,141 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from session_pipeline import SessionPipeline
+from tracker import IoUTracker
+
+TICK = 0.25
+# The detector takes two ticks
+INFERENCE_SECONDS = 0.5
+
+
+class FakeFrame:
+    """Stands in for an av.VideoFrame; every frame looks different so none is skipped"""
+
+    width, height = 640, 480
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def to_ndarray(self, format, width=None, height=None):
+        width, height = width or self.width, height or self.height
+        if format == "gray":
+            return self.rng.integers(0, 256, (height, width), dtype=np.uint8)
+        return np.zeros((height, width, 3), np.uint8)
+
+
+class SlowScheduler:
+    """Records submitted frames; the test resolves them INFERENCE_SECONDS later"""
+
+    batch_latency = None
+    queue_depth = 0
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.start = clock[0]
+        self.submitted = []
+
+    def submit(self, sid, img, imgsz=None, priority=0.0, profile=None, part=None):
+        future = asyncio.get_running_loop().create_future()
+        self.submitted.append((self.clock[0], img.shape[1], future))
+        return future
+
+    def discard(self, sid):
+        pass
+
+    def finish_due(self, now):
+        for submitted_at, width, future in self.submitted:
+            if not future.done() and submitted_at + INFERENCE_SECONDS <= now:
+                # One person walking right at 40 px/s, in detector input pixels
+                x = (100 + 40 * (submitted_at - self.start)) * width / FakeFrame.width
+                future.set_result([{"label": "person", "bbox": [x, 100, x + 100, 400],
+                                    "confidence": 0.9, "distance": 3.0}])
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    return clock
+
+
+def test_slow_detector_keeps_keyframe_cadence(clock):
+    sent = []
+
+    async def send(payload):
+        sent.append(payload)
+
+    async def main():
+        scheduler = SlowScheduler(clock)
+        pipeline = SessionPipeline("s", scheduler, send)
+        pipeline.controller.enabled = False
+        pipeline.tracker = IoUTracker(keyframe_interval=3)
+        frame = FakeFrame(np.random.default_rng(0))
+        start = clock[0]
+        try:
+            for tick in range(20):
+                clock[0] = start + tick * TICK
+                scheduler.finish_due(clock[0])
+                for _ in range(5):
+                    await asyncio.sleep(0)
+                pipeline.process(frame)
+            for _ in range(5):
+                await asyncio.sleep(0)
+        finally:
+            pipeline.stop()
+        return [round((submitted_at - start) / TICK) for submitted_at, _, _ in scheduler.submitted]
+
+    keyframe_ticks = asyncio.run(main())
+
+    # Every third tick once the first result is back, never back to back
+    assert keyframe_ticks[1:] == list(range(keyframe_ticks[1], 20, 3))
+    assert len(keyframe_ticks) >= 5
+
+    # Predictions keep flowing while a keyframe is on its way
+    keyframes = [payload for payload in sent if payload["keyframe"]]
+    assert len(keyframes) >= 4
+    assert len(sent) - len(keyframes) >= 8
+    # Late keyframes are carried forward, so the person never steps back to where they were
+    # two ticks ago (20 px); the filter may still correct a prediction by a pixel or two
+    positions = [payload["detections"][0]["bbox"][0] for payload in sent]
+    assert all(later >= earlier - 5 for earlier, later in zip(positions, positions[1:]))
+
+
+def test_hazards_to_a_slow_client_do_not_pile_up(clock):
+    delivered = []
+    release = None
+
+    async def send_hazard(payload):
+        delivered.append(payload)
+        await release.wait()
+
+    async def main():
+        nonlocal release
+        release = asyncio.Event()
+        pipeline = SessionPipeline("s", SlowScheduler(clock), None, send_hazard)
+        pipeline.frame_width = 640
+        try:
+            for i in range(20):
+                clock[0] += 0.05
+                # A different obstacle right ahead every time, so each one is urgent
+                pipeline.prioritize([{"label": f"obstacle {i}", "bbox": [270, 100, 370, 400],
+                                      "confidence": 0.9, "distance": 0.5}], clock[0])
+                await asyncio.sleep(0)
+            # One alert is being sent and only the newest waits behind it
+            assert len(delivered) == 1
+            assert pipeline.hazard_sender.queue.qsize() == 1
+
+            release.set()
+            for _ in range(5):
+                await asyncio.sleep(0)
+        finally:
+            pipeline.stop()
+        return pipeline.stats()
+
+    stats = asyncio.run(main())
+
+    assert [payload["hazards"][0]["label"] for payload in delivered] == ["obstacle 0", "obstacle 19"]
+    assert stats["hazards_dropped"] == 18
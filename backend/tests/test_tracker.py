@@ -0,0 +1,115 @@
+import numpy as np
+
+from tracker import IoUTracker, iou_matrix
+
+
+def det(bbox, label="person", confidence=0.9, distance=4.0):
+    return {"label": label, "bbox": bbox, "confidence": confidence, "distance": distance}
+
+
+def test_iou_matrix():
+    a = np.array([[0, 0, 10, 10], [20, 20, 30, 30]], dtype=np.float64)
+    b = np.array([[0, 0, 10, 10], [5, 0, 15, 10]], dtype=np.float64)
+
+    ious = iou_matrix(a, b)
+
+    np.testing.assert_allclose(ious, [[1.0, 50 / 150], [0.0, 0.0]])
+    assert iou_matrix(a, np.zeros((0, 4))).shape == (2, 0)
+
+
+def test_track_ids_are_stable_and_announced_once():
+    tracker = IoUTracker(max_misses=0)
+
+    first = tracker.update([det([100, 100, 200, 300]), det([400, 100, 450, 200], "chair")], now=0.0)
+    second = tracker.update([det([104, 100, 204, 300]), det([400, 102, 450, 202], "chair")], now=0.2)
+
+    assert [obj["track_id"] for obj in first] == [obj["track_id"] for obj in second]
+    assert [obj["new"] for obj in first] == [True, True]
+    assert [obj["new"] for obj in second] == [False, False]
+    assert not any(obj["predicted"] for obj in second)
+
+
+def test_labels_must_match():
+    tracker = IoUTracker()
+
+    first = tracker.update([det([100, 100, 200, 300])], now=0.0)
+    second = tracker.update([det([100, 100, 200, 300], "chair")], now=0.2)
+
+    chair = next(obj for obj in second if obj["label"] == "chair")
+    assert chair["track_id"] != first[0]["track_id"]
+    assert chair["new"]
+
+
+def test_unmatched_tracks_are_dropped_after_max_misses():
+    tracker = IoUTracker(max_misses=1)
+
+    tracker.update([det([100, 100, 200, 300])], now=0.0)
+    coasting = tracker.update([], now=0.2)
+    gone = tracker.update([], now=0.4)
+
+    assert len(coasting) == 1 and coasting[0]["predicted"]
+    assert gone == []
+
+
+def test_predict_carries_boxes_and_distances_forward():
+    tracker = IoUTracker()
+    tracker.update([det([100, 100, 200, 300], distance=4.0)], now=0.0)
+    # Moving right and growing as it approaches
+    tracker.update([det([110, 90, 210, 310], distance=3.6)], now=1.0)
+
+    before = tracker.peek(1.0)[0]
+    after = tracker.predict(2.0)[0]
+
+    assert after["predicted"]
+    assert after["bbox"][0] > before["bbox"][0]
+    assert after["distance"] < before["distance"]
+    assert after["confidence"] < before["confidence"]
+
+
+def test_needs_keyframe():
+    tracker = IoUTracker(keyframe_interval=3)
+    assert tracker.needs_keyframe(0.0, 640, 480)
+
+    tracker.update([det([100, 100, 200, 300], confidence=0.95)], now=0.0)
+    tracker.start_keyframe()
+    tracker.update([det([100, 100, 200, 300], confidence=0.95)], now=0.2)
+    # Keyframe, two predicted ticks, keyframe
+    for now in (0.4, 0.6):
+        assert not tracker.needs_keyframe(now, 640, 480)
+        tracker.predict(now)
+    assert tracker.needs_keyframe(0.8, 640, 480)
+
+
+def test_cadence_counts_from_the_submitted_keyframe():
+    tracker = IoUTracker(keyframe_interval=3)
+    tracker.update([det([100, 100, 200, 300], confidence=0.95)], now=0.0)
+
+    tracker.start_keyframe()
+    tracker.predict(0.2)
+    # The keyframe's result is only back now; the tick it took still counts
+    tracker.update([det([100, 100, 200, 300], confidence=0.95)], now=0.0)
+    assert not tracker.needs_keyframe(0.4, 640, 480)
+    tracker.predict(0.4)
+    assert tracker.needs_keyframe(0.6, 640, 480)
+
+
+def test_late_keyframe_is_carried_forward():
+    tracker = IoUTracker()
+    tracker.update([det([100, 100, 200, 300])], now=0.0)
+    tracker.update([det([110, 100, 210, 300])], now=1.0)
+
+    at_capture = tracker.peek(2.0)[0]["bbox"]
+    tracker.update([det([120, 100, 220, 300])], now=2.0)
+    carried, = tracker.update([det([130, 100, 230, 300])], now=3.0, report_at=4.0)
+
+    assert carried["predicted"]
+    assert carried["bbox"][0] > 130 > at_capture[0]
+
+
+def test_boxless_detections_pass_through():
+    tracker = IoUTracker()
+
+    results = tracker.update([{"label": "wall", "confidence": 0.5, "distance": 1.0}], now=0.0)
+
+    assert results == [{"label": "wall", "confidence": 0.5, "distance": 1.0}]
+    assert tracker.predict(0.2) == results
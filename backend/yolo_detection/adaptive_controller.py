@@ -0,0 +1,87 @@
+import os
+
+# Turn per-session adaptation off to always use the first quality level
+ADAPTIVE_CONTROL = os.environ.get("ADAPTIVE_CONTROL", "1") == "1"
+# Minimum seconds between analyzed frames per session at full quality (5 times per second)
+ANALYSIS_INTERVAL = float(os.environ.get("ANALYSIS_INTERVAL", 0.2))
+# Quality levels from best to cheapest: (detector input size, seconds between analyses)
+QUALITY_LEVELS = (
+    (640, ANALYSIS_INTERVAL),
+    (480, ANALYSIS_INTERVAL * 1.25),
+    (320, ANALYSIS_INTERVAL * 1.67),
+    (320, ANALYSIS_INTERVAL * 2.5),
+)
+# Minimum seconds between level changes, degrading reacts faster than recovering
+DEGRADE_COOLDOWN = float(os.environ.get("ADAPTIVE_DEGRADE_COOLDOWN", 1.0))
+RECOVER_COOLDOWN = float(os.environ.get("ADAPTIVE_RECOVER_COOLDOWN", 4.0))
+# Analyze static scenes this much less often
+STATIC_SCENE_SLOWDOWN = 1.5
+
+
+class AdaptiveController:
+    """
+    Picks a session's detector input size and analysis rate from measured
+    server load, queue depth and how much the scene is moving, so an
+    overloaded server degrades gracefully instead of falling behind.
+    """
+
+    def __init__(self, enabled=ADAPTIVE_CONTROL, levels=QUALITY_LEVELS):
+        self.enabled = enabled
+        self.levels = levels
+        self.level = 0
+        self.last_change = 0
+        self.scene_static = False
+
+    @property
+    def input_size(self):
+        return self.levels[self.level][0]
+
+    @property
+    def interval(self):
+        interval = self.levels[self.level][1]
+        return interval * STATIC_SCENE_SLOWDOWN if self.scene_static else interval
+
+    def update(self, now, batch_latency, queue_depth, scene_static):
+        """
+        Move one level up or down. batch_latency is the smoothed inference
+        time in seconds, queue_depth the waiting sessions per worker.
+        """
+        self.scene_static = scene_static
+        if not self.enabled or batch_latency is None:
+            return
+
+        budget = self.levels[self.level][1]
+        overloaded = batch_latency > budget * 0.8 or queue_depth > 1.0
+        underloaded = batch_latency < budget * 0.4 and queue_depth < 0.5
+
+        if overloaded and self.level < len(self.levels) - 1 and now - self.last_change >= DEGRADE_COOLDOWN:
+            self.level += 1
+            self.last_change = now
+        elif underloaded and self.level > 0 and now - self.last_change >= RECOVER_COOLDOWN:
+            self.level -= 1
+            self.last_change = now
+
+    def target_size(self, width, height, input_size=None):
+        """Frame size to decode to so its longest side is at most the input size"""
+        scale = min(1.0, (input_size or self.input_size) / max(width, height))
+        # libav wants even dimensions for most pixel formats
+        return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+    def settings(self):
+        return {
+            "level": self.level,
+            "input_size": self.input_size,
+            "analysis_interval": round(self.interval, 3),
+        }
+
+
+def scale_detections(detected_objects, scale_x, scale_y):
+    """Map detection boxes from a downscaled frame back to full-frame coordinates"""
+    if scale_x == 1 and scale_y == 1:
+        return detected_objects
+
+    for obj in detected_objects:
+        if obj.get("bbox"):
+            x1, y1, x2, y2 = obj["bbox"]
+            obj["bbox"] = [int(x1 * scale_x), int(y1 * scale_y), int(x2 * scale_x), int(y2 * scale_y)]
+    return detected_objects
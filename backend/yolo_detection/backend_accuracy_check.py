@@ -0,0 +1,116 @@
+"""
+Compare each inference backend's detections to the PyTorch baseline on a
+fixed set of images, and time them.
+
+    python backend_accuracy_check.py --images eval_frames/ --backends onnx openvino --int8
+"""
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from detection_pipeline import CONFIDENCE_THRESHOLD
+from inference_backends import list_images, load_detector
+from model_registry import YOLO_WEIGHTS
+from tracker import iou_matrix
+
+MATCH_IOU = 0.5
+
+
+def run_backend(model, images):
+    """Detections ((boxes, classes) per image) and per-frame latency in seconds"""
+    model(images[0], verbose=False)  # warm-up
+
+    detections, latencies = [], []
+    for img in images:
+        start_time = time.perf_counter()
+        result = model(img, verbose=False)[0]
+        latencies.append(time.perf_counter() - start_time)
+
+        data = result.boxes.data.cpu().numpy()
+        data = data[data[:, -2] >= CONFIDENCE_THRESHOLD]
+        detections.append((data[:, :4], data[:, -1].astype(np.int64)))
+
+    return detections, latencies
+
+
+def agreement(baseline, candidate):
+    """Precision, recall and F1 of candidate detections against the baseline"""
+    matched = baseline_total = candidate_total = 0
+
+    for (base_boxes, base_classes), (cand_boxes, cand_classes) in zip(baseline, candidate):
+        baseline_total += len(base_boxes)
+        candidate_total += len(cand_boxes)
+
+        ious = iou_matrix(base_boxes, cand_boxes)
+        ious[base_classes[:, None] != cand_classes[None, :]] = 0
+
+        used = set()
+        for i in range(len(base_boxes)):
+            for j in np.argsort(-ious[i]):
+                if ious[i, j] < MATCH_IOU:
+                    break
+                if j not in used:
+                    used.add(j)
+                    matched += 1
+                    break
+
+    precision = matched / candidate_total if candidate_total else 1.0
+    recall = matched / baseline_total if baseline_total else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+
+def latency_summary(latencies):
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="folder of evaluation images")
+    parser.add_argument("--weights", default=YOLO_WEIGHTS)
+    parser.add_argument("--backends", nargs="+", default=["onnx", "openvino"])
+    parser.add_argument("--int8", action="store_true", help="also check INT8 versions (needs CALIBRATION_IMAGES)")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    images = [img for img in (cv2.imread(path) for path in list_images(args.images)) if img is not None]
+    if not images:
+        print(f"No images found in {args.images}")
+        return
+
+    baseline, baseline_latencies = run_backend(load_detector(args.weights, "torch"), images)
+    baseline_mean = np.mean(baseline_latencies)
+    report = {"images": len(images), "torch": latency_summary(baseline_latencies)}
+
+    variants = [(backend, False) for backend in args.backends]
+    if args.int8:
+        variants += [(backend, True) for backend in args.backends]
+
+    for backend, int8 in variants:
+        name = f"{backend}_int8" if int8 else backend
+        detections, latencies = run_backend(load_detector(args.weights, backend, int8), images)
+        report[name] = {
+            **latency_summary(latencies),
+            "speedup": float(baseline_mean / np.mean(latencies)),
+            **agreement(baseline, detections),
+        }
+
+    for name, stats in report.items():
+        if name != "images":
+            print(name, json.dumps({key: round(value, 3) for key, value in stats.items()}))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
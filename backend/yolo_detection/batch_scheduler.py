@@ -0,0 +1,197 @@
+import asyncio
+import os
+
+from detection_pipeline import analyze_batch
+from distance_estimation import load_profile
+from frame_ring import release
+from metrics import ERRORS, observe_timings
+
+# Larger batches give more throughput per core, longer waits add latency
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 8))
+MAX_BATCH_WAIT_MS = float(os.environ.get("MAX_BATCH_WAIT_MS", 10))
+
+LATENCY_SMOOTHING = 0.2
+
+
+class BatchScheduler:
+    """
+    Collects pending frames from every session into micro-batches and runs
+    each batch as a single YOLO call on the inference executor.
+
+    Each session has a single "latest frame" slot: a new frame replaces one
+    that is still waiting, so inference always runs on the newest frame. A
+    session is never in two batches at once, so its detections come back in
+    capture order.
+    Sessions with near-field hazards (higher priority) go first.
+    """
+
+    def __init__(self, executor, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS):
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        # sid -> (img, future, imgsz, priority, camera profile), oldest waiting session first.
+        # img is an array or a FrameSlot in the shared frame ring
+        self.pending = {}
+        self.in_flight = set()
+        self._wakeup = asyncio.Event()
+        # Don't form a new batch until a worker can take it, so frames that
+        # arrive while every worker is busy join the next batch
+        self._free_workers = asyncio.Semaphore(executor.max_pending)
+        self._task = None
+        self.batches_run = 0
+        self.frames_run = 0
+        self.frames_replaced = 0
+        self.batch_latency = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def submit(self, sid, img, imgsz=None, priority=0.0, profile=None, part=None):
+        """
+        Put a frame in session sid's slot and return a future for its
+        detections. imgsz is the detector input size to use for it and
+        profile the session's camera profile. A frame already waiting in
+        the slot is dropped and its future cancelled. part names an extra
+        slot of the session, e.g. for one of its ROI tiles.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if part is not None:
+            sid = f"{sid}/{part}"
+
+        previous = self.pending.get(sid)
+        if previous is not None:
+            previous[1].cancel()
+            release(previous[0])
+            self.frames_replaced += 1
+
+        self.pending[sid] = (img, future, imgsz, priority, profile)
+        self._wakeup.set()
+        return future
+
+    def discard(self, sid):
+        """Forget a session's waiting frames, parts included, e.g. when it disconnects"""
+        for key in [key for key in self.pending if key == sid or key.startswith(f"{sid}/")]:
+            img, future = self.pending.pop(key)[:2]
+            future.cancel()
+            release(img)
+
+    def _ready_sids(self, imgsz=None):
+        """
+        Sessions with a frame waiting and none in flight, optionally for one
+        input size; highest priority first, then longest waiting
+        """
+        ready = [
+            (sid, priority) for sid, (_, _, size, priority, _) in self.pending.items()
+            if sid not in self.in_flight and (imgsz is None or size == imgsz)
+        ]
+        ready.sort(key=lambda item: item[1], reverse=True)
+        return [sid for sid, _ in ready]
+
+    async def _wait_for_frames(self, timeout=None):
+        self._wakeup.clear()
+        await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+    async def _collect_batch(self):
+        loop = asyncio.get_running_loop()
+
+        while not self._ready_sids():
+            await self._wait_for_frames()
+
+        # A batch shares one input size; the most urgent, longest waiting session picks it
+        first = self._ready_sids()[0]
+        imgsz = self.pending[first][2]
+
+        deadline = loop.time() + self.max_wait
+        while len(self._ready_sids(imgsz)) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                await self._wait_for_frames(timeout)
+            except asyncio.TimeoutError:
+                break
+
+        batch = []
+        for sid in self._ready_sids(imgsz)[:self.max_batch_size]:
+            img, future, _, _, profile = self.pending.pop(sid)
+            self.in_flight.add(sid)
+            batch.append((sid, img, future, profile))
+
+        return batch, imgsz
+
+    async def _run(self):
+        while True:
+            await self._free_workers.acquire()
+            try:
+                batch, imgsz = await self._collect_batch()
+            except BaseException:
+                self._free_workers.release()
+                raise
+            asyncio.ensure_future(self._run_batch(batch, imgsz))
+
+    async def _run_batch(self, batch, imgsz):
+        loop = asyncio.get_running_loop()
+        start_time = loop.time()
+        try:
+            results, timings = await self.executor.run(
+                analyze_batch,
+                [img for _, img, _, _ in batch],
+                imgsz=imgsz,
+                profiles=[profile or load_profile() for _, _, _, profile in batch],
+            )
+            observe_timings(timings)
+
+            # Smoothed batch latency, used by the sessions' adaptive controllers
+            latency = loop.time() - start_time
+            if self.batch_latency is None:
+                self.batch_latency = latency
+            else:
+                self.batch_latency += LATENCY_SMOOTHING * (latency - self.batch_latency)
+
+            self.batches_run += 1
+            self.frames_run += len(batch)
+
+            for (sid, img, future, _), detected_objects in zip(batch, results):
+                if not future.done():
+                    future.set_result(detected_objects)
+
+        except Exception as e:
+            print(f"Error processing batch: {e}")
+            ERRORS.inc(where="batch")
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for sid, img, _, _ in batch:
+                self.in_flight.discard(sid)
+                # Workers are done reading the frame's slot
+                release(img)
+            self._free_workers.release()
+            # Sessions that were in flight may have a newer frame waiting
+            self._wakeup.set()
+
+    @property
+    def queue_depth(self):
+        """Sessions waiting for a batch, per inference worker"""
+        return len(self.pending) / self.executor.max_pending
+
+    def stats(self):
+        return {
+            "waiting_sessions": len(self.pending),
+            "in_flight_sessions": len(self.in_flight),
+            "batches_run": self.batches_run,
+            "frames_run": self.frames_run,
+            "frames_replaced": self.frames_replaced,
+            "batch_latency_ms": self.batch_latency * 1000 if self.batch_latency is not None else None,
+            "avg_batch_size": self.frames_run / self.batches_run if self.batches_run else 0,
+        }
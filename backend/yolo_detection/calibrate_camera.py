@@ -0,0 +1,109 @@
+"""
+Derive a camera calibration profile from checkerboard photos taken with
+one device, and save it where the servers look for profiles.
+
+    python calibrate_camera.py --images pixel7_checkerboard/ --device "Pixel 7" --pattern 9x6 --square-size 2.5
+
+Take 15-30 photos of a printed checkerboard at different angles and
+distances, at the resolution the app streams. --pattern is the number of
+inner corners per row and column, --square-size the side of one square in
+centimeters.
+"""
+import argparse
+import json
+import os
+
+import cv2
+import numpy as np
+
+from distance_estimation import CALIBRATION_DIR, CameraProfile, load_profile, profile_key
+from inference_backends import list_images
+
+MIN_VIEWS = 5
+
+
+def find_corners(images, pattern):
+    """Checkerboard corners found in each image, and the image size"""
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+    corners_per_image, image_size = [], None
+
+    for path in images:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            print(f"Skipping {path}: could not be read")
+            continue
+        size = (gray.shape[1], gray.shape[0])
+        if image_size is not None and size != image_size:
+            print(f"Skipping {path}: {size[0]}x{size[1]} differs from {image_size[0]}x{image_size[1]}")
+            continue
+
+        found, corners = cv2.findChessboardCorners(gray, pattern, None)
+        if not found:
+            print(f"Skipping {path}: checkerboard not found")
+            continue
+        image_size = size
+        corners_per_image.append(cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria))
+
+    return corners_per_image, image_size
+
+
+def calibrate(corners_per_image, image_size, pattern, square_size):
+    """Camera matrix, distortion coefficients and RMS reprojection error in pixels"""
+    board = np.zeros((pattern[0] * pattern[1], 3), np.float32)
+    board[:, :2] = np.mgrid[0:pattern[0], 0:pattern[1]].T.reshape(-1, 2) * square_size
+    object_points = [board] * len(corners_per_image)
+
+    rms, camera_matrix, distortion, _, _ = cv2.calibrateCamera(
+        object_points, corners_per_image, image_size, None, None)
+    return camera_matrix, distortion.ravel(), rms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="folder of checkerboard photos from one device")
+    parser.add_argument("--device", required=True, help="device model the profile is for, e.g. \"Pixel 7\"")
+    parser.add_argument("--pattern", default="9x6", help="inner corners per row x per column")
+    parser.add_argument("--square-size", type=float, default=2.5, help="checkerboard square side in cm")
+    parser.add_argument("--distance-scale", type=float, default=1.0,
+                        help="extra factor applied to box-height distances, from measured ground truth")
+    parser.add_argument("--output-dir", default=CALIBRATION_DIR)
+    args = parser.parse_args()
+
+    pattern = tuple(int(v) for v in args.pattern.lower().split("x"))
+    corners_per_image, image_size = find_corners(list_images(args.images), pattern)
+    if len(corners_per_image) < MIN_VIEWS:
+        raise SystemExit(f"Found the checkerboard in {len(corners_per_image)} images, need at least {MIN_VIEWS}")
+
+    camera_matrix, distortion, rms = calibrate(corners_per_image, image_size, pattern, args.square_size)
+
+    # Keep class sizes and pose settings from the current default profile
+    base = load_profile().to_dict()
+    profile = CameraProfile.from_dict({
+        **base,
+        "image_size": list(image_size),
+        "fx": float(camera_matrix[0, 0]),
+        "fy": float(camera_matrix[1, 1]),
+        "cx": float(camera_matrix[0, 2]),
+        "cy": float(camera_matrix[1, 2]),
+        "distortion": distortion.tolist(),
+        "distance_scale": args.distance_scale,
+    }, name=profile_key(args.device))
+
+    data = profile.to_dict()
+    data["device"] = args.device
+    data["reprojection_error_px"] = round(float(rms), 4)
+    data["views"] = len(corners_per_image)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"{profile.name}.json")
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+    fov = np.degrees(2 * np.arctan(image_size[1] / (2 * profile.fy)))
+    print(f"{len(corners_per_image)} views, RMS reprojection error {rms:.3f} px")
+    print(f"fx={profile.fx:.1f} fy={profile.fy:.1f} at {image_size[0]}x{image_size[1]}, vertical FOV {fov:.1f} degrees")
+    print(f"Profile written to {path}")
+
+
+if __name__ == "__main__":
+    main()
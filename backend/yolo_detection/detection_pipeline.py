@@ -0,0 +1,167 @@
+import math
+import os
+
+import numpy as np
+
+from distance_estimation import load_profile
+from frame_ring import resolve, reused_buffer
+from metrics import timed
+from model_registry import registry
+
+CONFIDENCE_THRESHOLD = 0.4
+
+# Most people per frame that get a pose estimate
+MAX_POSE_PERSONS = int(os.environ.get("MAX_POSE_PERSONS", 3))
+# Margin added around each person box before running pose on it
+POSE_CROP_PADDING = 0.1
+MIN_POSE_CROP_SIZE = 32
+
+
+def extract_detections(result, frame_width, frame_height, profile):
+    """Turn one YOLO result into a list of detection dicts with distances from the camera profile"""
+    boxes = result.boxes
+    if len(boxes) == 0:
+        return []
+
+    # One transfer for every box: columns are x1, y1, x2, y2, [track id,] conf, cls
+    data = boxes.data.cpu().numpy()
+    data = data[data[:, -2] >= CONFIDENCE_THRESHOLD]  # Filter out low confidence detections
+    if len(data) == 0:
+        return []
+
+    xyxy = data[:, :4].astype(np.int64)
+    confidences = data[:, -2]
+    class_ids = data[:, -1].astype(np.int64)
+
+    real_heights_cm = profile.height_table(result.names)[class_ids]
+    distances = profile.distances(real_heights_cm, xyxy, frame_width, frame_height)
+
+    names = result.names
+    return [
+        {
+            "label": names[cls_id],
+            "confidence": conf,
+            "distance": None if math.isnan(distance) else distance,
+            "bbox": bbox,
+        }
+        for bbox, conf, cls_id, distance in zip(
+            xyxy.tolist(), confidences.tolist(), class_ids.tolist(), distances.tolist()
+        )
+    ]
+
+
+def estimate_person_distance(pose_results, crop_width, frame_width, frame_height, profile):
+    """Estimate person distance from shoulder width, or None if not visible"""
+    if not pose_results.pose_landmarks:
+        return None
+
+    import mediapipe as mp
+
+    landmarks = pose_results.pose_landmarks.landmark
+    left_shoulder = landmarks[mp.solutions.pose.PoseLandmark.LEFT_SHOULDER]
+    right_shoulder = landmarks[mp.solutions.pose.PoseLandmark.RIGHT_SHOULDER]
+
+    if left_shoulder.visibility <= 0.5 or right_shoulder.visibility <= 0.5:
+        return None
+
+    # Landmarks are normalized to the crop the pose ran on
+    shoulder_width_px = abs(left_shoulder.x - right_shoulder.x) * crop_width
+    if shoulder_width_px <= 0:
+        return None
+
+    # Pinhole camera model with the profile's focal length and shoulder width
+    return profile.shoulder_distance(shoulder_width_px, frame_width, frame_height)
+
+
+def person_crop(img, bbox):
+    """Return the BGR crop around a person box, padded a little, or None if too small"""
+    frame_height, frame_width = img.shape[0], img.shape[1]
+    x1, y1, x2, y2 = bbox
+    pad_x = int((x2 - x1) * POSE_CROP_PADDING)
+    pad_y = int((y2 - y1) * POSE_CROP_PADDING)
+    x1, y1 = max(0, x1 - pad_x), max(0, y1 - pad_y)
+    x2, y2 = min(frame_width, x2 + pad_x), min(frame_height, y2 + pad_y)
+
+    if x2 - x1 < MIN_POSE_CROP_SIZE or y2 - y1 < MIN_POSE_CROP_SIZE:
+        return None
+    return img[y1:y2, x1:x2]
+
+
+def refine_person_distances(img, detected_objects, pose, timings, profile):
+    """Run pose on the largest person crops and use their shoulder width for distance"""
+    people = [obj for obj in detected_objects if obj["label"] == "person"]
+    if not people or MAX_POSE_PERSONS <= 0:
+        return
+
+    import cv2
+
+    frame_height, frame_width = img.shape[:2]
+
+    # The closest people are the most relevant and the largest on screen
+    people.sort(key=lambda obj: (obj["bbox"][2] - obj["bbox"][0]) * (obj["bbox"][3] - obj["bbox"][1]), reverse=True)
+
+    for obj in people[:MAX_POSE_PERSONS]:
+        crop = person_crop(img, obj["bbox"])
+        if crop is None:
+            continue
+
+        # Only the crop is converted, not the whole frame, into a buffer reused across crops
+        with timed(timings, "color_conversion"):
+            crop_rgb = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB, dst=reused_buffer(crop.shape))
+        with timed(timings, "pose"):
+            pose_results = pose.process(crop_rgb)
+        distance_m = estimate_person_distance(pose_results, crop.shape[1], frame_width, frame_height, profile)
+        if distance_m is not None:
+            # Shoulder width holds up when the body is cut off by the frame edge
+            obj["distance"] = float(distance_m)
+
+
+def analyze_frames(frames, use_pose=True, imgsz=None, timings=None, profiles=None):
+    """
+    Run detection and distance estimation on a list of BGR frames.
+    All frames go through YOLO as a single batched call, at input size
+    imgsz if given; pose only runs on the people YOLO found. profiles are
+    the camera profiles of the frames, the default profile if not given.
+    Seconds spent per stage are added to the timings dict if one is given.
+    """
+    if not frames:
+        return []
+    if timings is None:
+        timings = {}
+    if profiles is None:
+        profiles = [load_profile()] * len(frames)
+
+    with timed(timings, "yolo"):
+        yolo_results = registry.detect(frames, imgsz=imgsz) if imgsz else registry.detect(frames)
+    outputs = []
+
+    for img, result, profile in zip(frames, yolo_results, profiles):
+        frame_height, frame_width = img.shape[:2]
+        with timed(timings, "postprocess"):
+            detected_objects = extract_detections(result, frame_width, frame_height, profile)
+
+        if use_pose and any(obj["label"] == "person" for obj in detected_objects):
+            with registry.pose() as pose:
+                refine_person_distances(img, detected_objects, pose, timings, profile)
+
+        outputs.append(detected_objects)
+
+    return outputs
+
+
+def analyze_batch(frames, imgsz=None, profiles=None):
+    """
+    Executor job: analyze a batch and return (results, stage timings), so the
+    timings reach the metrics of the parent even from a worker process.
+    frames may be FrameSlots, which only carry a shared memory location.
+    """
+    timings = {}
+    # Frames in the shared frame ring are read in place
+    frames = [resolve(frame) for frame in frames]
+    results = analyze_frames(frames, imgsz=imgsz, timings=timings, profiles=profiles)
+    return results, timings
+
+
+def analyze_frame(img, use_pose=True, imgsz=None):
+    """Run detection and distance estimation on a single BGR frame"""
+    return analyze_frames([img], use_pose=use_pose, imgsz=imgsz)[0]
@@ -0,0 +1,242 @@
+import copy
+import functools
+import json
+import math
+import os
+import re
+
+import numpy as np
+
+# Reference sizes for common objects (cm)
+reference_sizes = {
+    "person": 170, "chair": 80, "dining table": 75, "couch": 90,
+    "bed": 60, "refrigerator": 180, "tv": 55, "laptop": 35,
+    "cell phone": 15, "book": 25, "bottle": 25,
+}
+
+# Average adult shoulder width (cm), for distances from pose landmarks
+SHOULDER_WIDTH_CM = 40
+# Field of view assumed for cameras without a calibration profile
+DEFAULT_FOV_DEG = 60
+# Shoulder-width distances read long without it
+DEFAULT_POSE_DISTANCE_SCALE = 0.8
+
+# Folder of <device>.json calibration profiles, and the profile used when a device has none
+CALIBRATION_DIR = os.environ.get(
+    "CALIBRATION_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration_profiles"))
+CAMERA_PROFILE = os.environ.get("CAMERA_PROFILE", "default")
+
+# Distortion coefficient counts OpenCV accepts
+DISTORTION_LENGTHS = (4, 5, 8, 12, 14)
+
+
+class CameraProfile:
+    """
+    Intrinsics, lens distortion and object sizes for one camera. Intrinsics
+    are given at the calibration resolution (image_size) and scaled to each
+    frame size once; class sizes are turned into per-class-ID arrays once,
+    so the per-box work is plain array arithmetic.
+
+    Without measured intrinsics the focal length comes from fov_deg,
+    assumed the same across the width and the height.
+    """
+
+    def __init__(self, name="default", image_size=None, fx=None, fy=None, cx=None, cy=None,
+                 distortion=None, fov_deg=DEFAULT_FOV_DEG, class_heights_cm=None,
+                 shoulder_width_cm=SHOULDER_WIDTH_CM, distance_scale=1.0,
+                 pose_distance_scale=DEFAULT_POSE_DISTANCE_SCALE):
+        self.name = name
+        self.image_size = tuple(image_size) if image_size else None
+        self.fx, self.fy, self.cx, self.cy = fx, fy, cx, cy
+        self.distortion = np.asarray(distortion, dtype=np.float64) if distortion else None
+        if self.distortion is not None and not self.distortion.any():
+            self.distortion = None
+        self.fov_deg = fov_deg
+        self.class_heights_cm = {**reference_sizes, **(class_heights_cm or {})}
+        self.shoulder_width_cm = shoulder_width_cm
+        self.distance_scale = distance_scale
+        self.pose_distance_scale = pose_distance_scale
+        # (x, y, frame width, frame height) when this is the profile of a crop, see cropped()
+        self.crop = None
+        self._intrinsics = {}
+        self._height_tables = {}
+
+    @property
+    def calibrated(self):
+        return self.fx is not None and self.fy is not None and self.image_size is not None
+
+    def _frame_intrinsics(self, width, height):
+        if self.calibrated:
+            scale_x, scale_y = width / self.image_size[0], height / self.image_size[1]
+            cx = self.cx if self.cx is not None else self.image_size[0] / 2
+            cy = self.cy if self.cy is not None else self.image_size[1] / 2
+            return self.fx * scale_x, self.fy * scale_y, cx * scale_x, cy * scale_y
+
+        # Simple pinhole model from the field of view
+        tan_half_fov = math.tan(math.radians(self.fov_deg) / 2)
+        return width / (2 * tan_half_fov), height / (2 * tan_half_fov), width / 2, height / 2
+
+    def intrinsics(self, width, height):
+        """(fx, fy, cx, cy) in pixels for a frame of this size, or for a crop of this size"""
+        key = (width, height)
+        intrinsics = self._intrinsics.get(key)
+        if intrinsics is None:
+            if self.crop is not None:
+                # Same focal length as the full frame, principal point relative to the crop
+                x, y, frame_width, frame_height = self.crop
+                fx, fy, cx, cy = self._frame_intrinsics(frame_width, frame_height)
+                intrinsics = (fx, fy, cx - x, cy - y)
+            else:
+                intrinsics = self._frame_intrinsics(width, height)
+            self._intrinsics[key] = intrinsics
+        return intrinsics
+
+    def cropped(self, x, y, frame_width, frame_height):
+        """
+        This profile for a full-resolution crop at (x, y) of a frame_width x
+        frame_height frame, so detections in the crop get full-frame distances
+        """
+        profile = copy.copy(self)
+        profile.crop = (x, y, frame_width, frame_height)
+        profile._intrinsics = {}
+        return profile
+
+    def height_table(self, names):
+        """Array of reference heights (cm) indexed by class id, NaN for unknown classes"""
+        key = tuple(names[i] for i in range(len(names)))
+        table = self._height_tables.get(key)
+        if table is None:
+            table = np.array([self.class_heights_cm.get(name, np.nan) for name in key], dtype=np.float64)
+            self._height_tables[key] = table
+        return table
+
+    def box_heights(self, boxes, width, height):
+        """Pixel heights of x1, y1, x2, y2 boxes, corrected for lens distortion when known"""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if self.distortion is None or len(boxes) == 0:
+            return boxes[:, 3] - boxes[:, 1]
+
+        import cv2
+
+        # Undistort the top and bottom center of every box in one call
+        fx, fy, cx, cy = self.intrinsics(width, height)
+        camera_matrix = np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]])
+        centers = (boxes[:, 0] + boxes[:, 2]) / 2
+        points = np.stack([np.stack([centers, boxes[:, 1]], 1), np.stack([centers, boxes[:, 3]], 1)], 1)
+        undistorted = cv2.undistortPoints(points.reshape(-1, 1, 2), camera_matrix, self.distortion, P=camera_matrix)
+        undistorted = undistorted.reshape(-1, 2, 2)
+        return undistorted[:, 1, 1] - undistorted[:, 0, 1]
+
+    def distances(self, real_heights_cm, boxes, width, height):
+        """
+        Distances in meters from reference heights and boxes in a frame of
+        this size. Unknown classes and empty boxes give NaN.
+        """
+        bbox_heights = self.box_heights(boxes, width, height)
+        distances = np.full(bbox_heights.shape, np.nan)
+        valid = (bbox_heights > 0) & ~np.isnan(real_heights_cm)
+        fy = self.intrinsics(width, height)[1]
+        distances[valid] = real_heights_cm[valid] * fy / bbox_heights[valid] / 100 * self.distance_scale
+        return distances
+
+    def shoulder_distance(self, shoulder_width_px, width, height):
+        """Distance in meters of a person whose shoulders are shoulder_width_px apart"""
+        fx = self.intrinsics(width, height)[0]
+        return self.shoulder_width_cm * fx / shoulder_width_px / 100 * self.pose_distance_scale
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "image_size": list(self.image_size) if self.image_size else None,
+            "fx": self.fx, "fy": self.fy, "cx": self.cx, "cy": self.cy,
+            "distortion": self.distortion.tolist() if self.distortion is not None else None,
+            "fov_deg": self.fov_deg,
+            # Only what differs from the built-in reference sizes
+            "class_heights_cm": {k: v for k, v in self.class_heights_cm.items() if reference_sizes.get(k) != v},
+            "shoulder_width_cm": self.shoulder_width_cm,
+            "distance_scale": self.distance_scale,
+            "pose_distance_scale": self.pose_distance_scale,
+        }
+
+    @classmethod
+    def from_dict(cls, data, name=None):
+        fields = ("image_size", "fx", "fy", "cx", "cy", "distortion", "fov_deg", "class_heights_cm",
+                  "shoulder_width_cm", "distance_scale", "pose_distance_scale")
+        return cls(name=name or data.get("name", "custom"), **{k: data[k] for k in fields if data.get(k) is not None})
+
+
+DEFAULT_PROFILE = CameraProfile()
+
+
+def profile_key(device):
+    """File name for a device model, e.g. "Pixel 7 Pro" -> "pixel_7_pro" """
+    return re.sub(r"[^a-z0-9]+", "_", str(device).lower()).strip("_")
+
+
+@functools.lru_cache(maxsize=64)
+def load_profile(name=CAMERA_PROFILE):
+    """Calibration profile from CALIBRATION_DIR, loaded once; the default profile if there is none"""
+    path = os.path.join(CALIBRATION_DIR, f"{profile_key(name)}.json")
+    if not os.path.exists(path):
+        return DEFAULT_PROFILE if name == CAMERA_PROFILE else load_profile(CAMERA_PROFILE)
+    try:
+        with open(path) as f:
+            return CameraProfile.from_dict(json.load(f), name=profile_key(name))
+    except (OSError, ValueError, TypeError) as e:
+        print(f"Error loading calibration profile {path}: {e}")
+        return DEFAULT_PROFILE
+
+
+def _positive(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value) and value > 0
+
+
+def check_calibration(data):
+    """
+    Raise ValueError unless a client-sent calibration has sane types and
+    values, so a bad one can't poison every distance of its session
+    """
+    image_size = data.get("image_size")
+    if image_size is not None and (
+            not isinstance(image_size, (list, tuple)) or len(image_size) != 2
+            or not all(_positive(v) for v in image_size)):
+        raise ValueError("image_size must be two positive numbers")
+    for key in ("fx", "fy", "fov_deg", "shoulder_width_cm", "distance_scale", "pose_distance_scale"):
+        if data.get(key) is not None and not _positive(data[key]):
+            raise ValueError(f"{key} must be a positive number")
+    for key in ("cx", "cy"):
+        if data.get(key) is not None and not (_positive(data[key]) or data[key] == 0):
+            raise ValueError(f"{key} must be a non-negative number")
+    if data.get("fov_deg") is not None and data["fov_deg"] >= 180:
+        raise ValueError("fov_deg must be under 180")
+
+    distortion = data.get("distortion")
+    if distortion is not None and (
+            not isinstance(distortion, (list, tuple)) or len(distortion) not in DISTORTION_LENGTHS
+            or not all(isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v)
+                       for v in distortion)):
+        raise ValueError(f"distortion must be {', '.join(map(str, DISTORTION_LENGTHS))} numbers")
+
+    class_heights = data.get("class_heights_cm")
+    if class_heights is not None and (
+            not isinstance(class_heights, dict) or not all(_positive(v) for v in class_heights.values())):
+        raise ValueError("class_heights_cm must map class names to positive numbers")
+
+
+def session_profile(auth):
+    """
+    Profile for a Socket.IO session from its connect auth payload: inline
+    "calibration" intrinsics first, then the profile for its "device"
+    model, then the server default. An invalid calibration is ignored.
+    """
+    if isinstance(auth, dict):
+        if isinstance(auth.get("calibration"), dict):
+            try:
+                check_calibration(auth["calibration"])
+                return CameraProfile.from_dict(auth["calibration"], name="session")
+            except (TypeError, ValueError) as e:
+                print(f"Ignoring invalid session calibration: {e}")
+        if auth.get("device"):
+            return load_profile(auth["device"])
+    return load_profile()
+
@@ -0,0 +1,209 @@
+import os
+import threading
+from collections import deque, namedtuple
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from inference_executor import INFERENCE_EXECUTOR
+from roi_tiling import INFERENCE_MODE, MAX_ROIS
+from session_manager import MAX_SESSIONS
+
+# Frames a session can hold in slots at once: one waiting for a batch and one in a running
+# batch, for the full frame and, in tiled mode, for each tile
+FRAMES_PER_SESSION = 2 * (1 + MAX_ROIS if INFERENCE_MODE == "tiled" else 1)
+
+# Preallocated frame slots shared by every session of a process; 0 passes frames as ordinary arrays.
+# Only used with INFERENCE_EXECUTOR=process: threads read ordinary arrays without a copy
+FRAME_RING_SLOTS = int(os.environ.get("FRAME_RING_SLOTS", (MAX_SESSIONS or 16) * FRAMES_PER_SESSION))
+# Longest side of a frame a slot holds; frames are decoded at the detector input size, at most 640
+FRAME_SLOT_SIZE = int(os.environ.get("FRAME_SLOT_SIZE", 640))
+# Most shared memory the ring may take; Docker gives containers 64 MiB of /dev/shm by default
+FRAME_RING_MAX_MB = int(os.environ.get("FRAME_RING_MAX_MB", 48))
+
+# Where POSIX shared memory lives on Linux; the ring takes at most half of what is free there
+SHM_DIR = "/dev/shm"
+
+# A decoded BGR frame in a ring slot. Small and picklable, so it is what goes
+# to the inference workers instead of the pixels
+FrameSlot = namedtuple("FrameSlot", ["ring", "index", "offset", "height", "width"])
+
+# Shared memory blocks this process created or attached to, by name
+_blocks = {}
+_ring = None
+_ring_failed = False
+_ring_lock = threading.Lock()
+_scratch = threading.local()
+
+
+class FrameRing:
+    """
+    Fixed pool of frame-sized slots in one shared memory block. The WebRTC
+    side decodes each frame straight into a free slot; inference threads
+    or worker processes read it in place through resolve(), so frames are
+    neither copied again nor pickled. A slot is released once its batch
+    has run or its frame was replaced by a newer one.
+
+    Slots are only taken and released on the event loop, so the free list
+    needs no lock.
+    """
+
+    def __init__(self, slots=FRAME_RING_SLOTS, max_side=FRAME_SLOT_SIZE):
+        self.slots = slots
+        self.slot_bytes = max_side * max_side * 3
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * self.slot_bytes)
+        self.name = self.shm.name
+        _blocks[self.name] = self.shm
+        self.free = deque(range(slots))
+        self.used = set()
+        self.writes = 0
+        # Frames that didn't fit or found every slot taken, passed as ordinary arrays
+        self.fallbacks = 0
+
+    def write(self, frame, width, height):
+        """
+        Decode an av.VideoFrame into a free slot as BGR at width x height
+        and return its FrameSlot, or None if it doesn't fit or no slot is free.
+        """
+        slot = self._take(width, height)
+        if slot is None:
+            return None
+
+        # libav scales and converts in one pass; its output is copied into the slot once
+        plane = frame.reformat(width=width, height=height, format="bgr24").planes[0]
+        pixels = np.frombuffer(plane, np.uint8).reshape(height, plane.line_size)[:, :width * 3]
+        np.copyto(resolve(slot), pixels.reshape(height, width, 3))
+        return slot
+
+    def write_array(self, img):
+        """Copy a BGR array, e.g. a tile of a full-resolution frame, into a free slot; None if it can't"""
+        slot = self._take(img.shape[1], img.shape[0])
+        if slot is not None:
+            np.copyto(resolve(slot), img)
+        return slot
+
+    def _take(self, width, height):
+        if width * height * 3 > self.slot_bytes or not self.free:
+            self.fallbacks += 1
+            return None
+
+        index = self.free.popleft()
+        self.used.add(index)
+        self.writes += 1
+        return FrameSlot(self.name, index, index * self.slot_bytes, height, width)
+
+    def release(self, slot):
+        if slot.index in self.used:
+            self.used.discard(slot.index)
+            self.free.append(slot.index)
+
+    def close(self):
+        _blocks.pop(self.name, None)
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # A view is still alive; the block goes away with the process
+        self.shm.unlink()
+
+    def stats(self):
+        return {
+            "slots": self.slots,
+            "in_use": len(self.used),
+            "slot_kb": self.slot_bytes // 1024,
+            "writes": self.writes,
+            "fallbacks": self.fallbacks,
+        }
+
+
+def ring_slots(slots=FRAME_RING_SLOTS, max_side=FRAME_SLOT_SIZE):
+    """
+    Slots that fit the shared memory budget. Linux doesn't reserve shared
+    memory up front, so an oversized block only fails later with SIGBUS
+    when a frame is written into it; it has to be sized to fit beforehand.
+    """
+    budget = FRAME_RING_MAX_MB * 1024 * 1024
+    try:
+        stat = os.statvfs(SHM_DIR)
+        budget = min(budget, stat.f_bavail * stat.f_frsize // 2)
+    except OSError:
+        pass  # No /dev/shm, e.g. on macOS
+    return min(slots, budget // (max_side * max_side * 3))
+
+
+def shared_ring():
+    """
+    The process's frame ring, created on first use; None with the thread
+    executor, when FRAME_RING_SLOTS is 0 or when the ring couldn't be made
+    """
+    global _ring, _ring_failed
+    if INFERENCE_EXECUTOR != "process" or FRAME_RING_SLOTS <= 0 or _ring_failed:
+        return None
+    with _ring_lock:
+        if _ring is None and not _ring_failed:
+            slots = ring_slots()
+            try:
+                if slots <= 0:
+                    raise OSError("not enough shared memory for one slot")
+                _ring = FrameRing(slots)
+            except OSError as e:
+                print(f"Frame ring unavailable, passing frames as arrays: {e}")
+                _ring_failed = True
+                return None
+    return _ring
+
+
+def close_ring():
+    """
+    Unlink the process's frame ring. Only call it once the inference
+    workers have exited: a worker still reading a slot would fault.
+    """
+    global _ring
+    with _ring_lock:
+        if _ring is not None:
+            _ring.close()
+            _ring = None
+
+
+def _attach(name):
+    try:
+        # Python 3.13+: the creating process owns the block's lifetime
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Older Pythons register attached blocks with the resource tracker too, which
+        # then reports them as leaked and unlinks them behind the creator's back. The
+        # tracker is shared with the creator under spawn, so unregistering afterwards
+        # would drop the creator's entry instead; the block is never registered here
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+    _blocks[name] = shm
+    return shm
+
+
+def resolve(frame):
+    """A NumPy view of a FrameSlot's pixels; ordinary arrays are returned as they are"""
+    if not isinstance(frame, FrameSlot):
+        return frame
+    shm = _blocks.get(frame.ring) or _attach(frame.ring)
+    return np.ndarray((frame.height, frame.width, 3), np.uint8, buffer=shm.buf, offset=frame.offset)
+
+
+def release(frame):
+    """Give a frame's slot back to the ring; no-op for ordinary arrays"""
+    if isinstance(frame, FrameSlot) and _ring is not None and frame.ring == _ring.name:
+        _ring.release(frame)
+
+
+def reused_buffer(shape, dtype=np.uint8):
+    """
+    Array of this shape backed by a per-thread buffer that only grows, for
+    results used right away like color conversions of person crops
+    """
+    size = int(np.prod(shape))
+    buffer = getattr(_scratch, "buffer", None)
+    if buffer is None or buffer.size < size or buffer.dtype != dtype:
+        buffer = _scratch.buffer = np.empty(size, dtype)
+    return buffer[:size].reshape(shape)
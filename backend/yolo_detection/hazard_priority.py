@@ -0,0 +1,120 @@
+import os
+
+# Objects closer than this (meters) and roughly ahead are near-field hazards
+HAZARD_DISTANCE = float(os.environ.get("HAZARD_DISTANCE", 1.5))
+# Near-field hazards and objects at or above this priority are announced right away on the fast path
+URGENT_PRIORITY = float(os.environ.get("URGENT_PRIORITY", 0.7))
+# Don't announce the same track again within this many seconds unless it got closer
+HAZARD_REPEAT_SECONDS = float(os.environ.get("HAZARD_REPEAT_SECONDS", 2.0))
+# Between analysis ticks, re-check predicted tracks for hazards at most this often
+HAZARD_CHECK_INTERVAL = float(os.environ.get("HAZARD_CHECK_INTERVAL", 0.05))
+
+# Beyond this distance an object adds nothing to the distance term
+MAX_RELEVANT_DISTANCE = 5.0
+# Approach speed (m/s) at which the approach term saturates
+APPROACH_SPEED_SCALE = 1.0
+DISTANCE_WEIGHT = 0.5
+CENTER_WEIGHT = 0.25
+APPROACH_WEIGHT = 0.25
+SPEED_SMOOTHING = 0.5
+# A hazard that got this much closer (meters) is announced again before the repeat time
+REALERT_CLOSER_BY = 0.3
+
+
+class HazardScorer:
+    """
+    Scores a session's objects by how close they are, how near the center
+    of the frame and how fast they are approaching, so the nearest object
+    in the user's path is reported first and urgent ones immediately.
+    """
+
+    def __init__(self):
+        # track_id -> (time, distance, smoothed approach speed in m/s)
+        self.history = {}
+        # track_id -> (time, distance) of its last urgent announcement
+        self.alerted = {}
+        # Highest priority among the session's current near-field hazards, 0 when none
+        self.session_priority = 0.0
+
+    def _approach_speed(self, obj, now, update):
+        track_id = obj.get("track_id")
+        distance = obj.get("distance")
+        if track_id is None or distance is None:
+            return 0.0
+
+        previous = self.history.get(track_id)
+        if previous is None:
+            speed = 0.0
+        else:
+            last_time, last_distance, speed = previous
+            dt = now - last_time
+            if update and dt > 0:
+                speed += SPEED_SMOOTHING * ((last_distance - distance) / dt - speed)
+        if update:
+            self.history[track_id] = (now, distance, speed)
+        return speed
+
+    def prioritize(self, detected_objects, frame_width, now, update=True):
+        """
+        Return copies of the objects with "priority" (0-1), "approach_speed"
+        and "hazard" added, highest priority first. update=False scores
+        predicted positions without changing the speed estimates.
+        """
+        scored = []
+        for obj in detected_objects:
+            distance = obj.get("distance")
+            proximity = 0.0 if distance is None else max(0.0, 1.0 - distance / MAX_RELEVANT_DISTANCE)
+
+            bbox = obj.get("bbox")
+            if bbox and frame_width:
+                offset = abs((bbox[0] + bbox[2]) / 2 / frame_width - 0.5) * 2
+                centrality = max(0.0, 1.0 - offset)
+            else:
+                centrality = 0.5
+
+            speed = self._approach_speed(obj, now, update)
+            approach = min(max(speed / APPROACH_SPEED_SCALE, 0.0), 1.0)
+
+            priority = DISTANCE_WEIGHT * proximity + CENTER_WEIGHT * centrality + APPROACH_WEIGHT * approach
+            hazard = distance is not None and distance <= HAZARD_DISTANCE and centrality >= 1 / 3
+            scored.append(dict(
+                obj,
+                priority=round(priority, 3),
+                approach_speed=round(speed, 2),
+                hazard=hazard,
+            ))
+
+        scored.sort(key=lambda obj: obj["priority"], reverse=True)
+
+        if update:
+            # Forget tracks that are gone
+            current = {obj.get("track_id") for obj in scored}
+            for track_id in [t for t in self.history if t not in current]:
+                del self.history[track_id]
+                self.alerted.pop(track_id, None)
+
+        hazards = [obj["priority"] for obj in scored if obj["hazard"]]
+        self.session_priority = max(hazards) if hazards else 0.0
+        return scored
+
+    @property
+    def near_field(self):
+        return self.session_priority > 0
+
+    def urgent(self, scored, now):
+        """Objects to announce on the fast path now: urgent and not just announced"""
+        urgent = []
+        for obj in scored:
+            if obj["priority"] < URGENT_PRIORITY and not obj["hazard"]:
+                continue
+
+            # Untracked objects can only be told apart by label
+            key = obj.get("track_id") or obj["label"]
+            previous = self.alerted.get(key)
+            distance = obj.get("distance")
+            closer = (previous is not None and distance is not None and previous[1] is not None
+                      and distance < previous[1] - REALERT_CLOSER_BY)
+            if previous is None or now - previous[0] >= HAZARD_REPEAT_SECONDS or closer:
+                self.alerted[key] = (now, distance)
+                urgent.append(obj)
+        return urgent
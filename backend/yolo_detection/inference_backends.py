@@ -0,0 +1,133 @@
+import glob
+import os
+import tempfile
+
+import numpy as np
+
+# "torch" (PyTorch eager), "onnx" (ONNX Runtime) or "openvino"
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch")
+# Quantize exported models to INT8 using the calibration images
+INFERENCE_INT8 = os.environ.get("INFERENCE_INT8", "0") == "1"
+# Directory of representative frames used for INT8 calibration
+CALIBRATION_IMAGES = os.environ.get("CALIBRATION_IMAGES", "")
+EXPORT_IMGSZ = int(os.environ.get("EXPORT_IMGSZ", 640))
+
+BACKENDS = ("torch", "onnx", "openvino")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def list_images(directory):
+    """Sorted image paths in a directory"""
+    paths = []
+    for extension in IMAGE_EXTENSIONS:
+        paths.extend(glob.glob(os.path.join(directory, f"*{extension}")))
+        paths.extend(glob.glob(os.path.join(directory, f"*{extension.upper()}")))
+    return sorted(set(paths))
+
+
+def letterbox(img, size=EXPORT_IMGSZ):
+    """Resize keeping aspect ratio and pad to size x size, like the YOLO preprocessor"""
+    import cv2
+
+    height, width = img.shape[:2]
+    scale = min(size / height, size / width)
+    resized = cv2.resize(img, (int(round(width * scale)), int(round(height * scale))),
+                         interpolation=cv2.INTER_LINEAR)
+    padded = np.full((size, size, 3), 114, dtype=np.uint8)
+    top = (size - resized.shape[0]) // 2
+    left = (size - resized.shape[1]) // 2
+    padded[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return padded
+
+
+def _calibration_yaml(model, calibration_images):
+    """Write a throwaway dataset file so ultralytics can calibrate on a plain image folder"""
+    directory = os.path.abspath(calibration_images)
+    handle, path = tempfile.mkstemp(suffix=".yaml")
+    with os.fdopen(handle, "w") as f:
+        f.write(f"path: {directory}\ntrain: .\nval: .\nnames:\n")
+        for index, name in model.names.items():
+            f.write(f"  {index}: \"{name}\"\n")
+    return path
+
+
+def _quantize_onnx(onnx_path, output_path, calibration_images, imgsz):
+    """Statically quantize an exported ONNX model to INT8 with ONNX Runtime"""
+    import cv2
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self, paths):
+            self.paths = iter(paths)
+
+        def get_next(self):
+            for path in self.paths:
+                img = cv2.imread(path)
+                if img is None:
+                    continue
+                # Same preprocessing as inference: letterbox, BGR to RGB, CHW, 0-1
+                rgb = cv2.cvtColor(letterbox(img, imgsz), cv2.COLOR_BGR2RGB)
+                return {"images": rgb.transpose(2, 0, 1)[None].astype(np.float32) / 255}
+            return None
+
+    quantize_static(
+        onnx_path,
+        output_path,
+        FrameReader(list_images(calibration_images)),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+
+
+def export_model(weights, backend, int8=False, calibration_images=CALIBRATION_IMAGES, imgsz=EXPORT_IMGSZ):
+    """
+    Return the path of the model to load for a backend, exporting (and
+    quantizing) it next to the PyTorch weights the first time.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    if backend == "torch":
+        return weights
+    if int8 and not (calibration_images and list_images(calibration_images)):
+        raise ValueError("INT8 quantization needs CALIBRATION_IMAGES pointing at a folder of frames")
+
+    from ultralytics import YOLO
+
+    stem = os.path.splitext(weights)[0]
+    suffix = "_int8" if int8 else ""
+
+    if backend == "onnx":
+        onnx_path = f"{stem}.onnx"
+        if not os.path.exists(onnx_path):
+            # Dynamic axes so the micro-batches can have any size
+            YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+        if not int8:
+            return onnx_path
+
+        quantized_path = f"{stem}{suffix}.onnx"
+        if not os.path.exists(quantized_path):
+            _quantize_onnx(onnx_path, quantized_path, calibration_images, imgsz)
+        return quantized_path
+
+    openvino_dir = f"{stem}{suffix}_openvino_model"
+    if not os.path.exists(openvino_dir):
+        model = YOLO(weights)
+        data = _calibration_yaml(model, calibration_images) if int8 else None
+        try:
+            exported = model.export(format="openvino", imgsz=imgsz, dynamic=True, int8=int8, data=data)
+        finally:
+            if data:
+                os.remove(data)
+        if os.path.abspath(exported) != os.path.abspath(openvino_dir):
+            os.replace(exported, openvino_dir)
+    return openvino_dir
+
+
+def load_detector(weights, backend=INFERENCE_BACKEND, int8=INFERENCE_INT8):
+    """Load YOLO on the configured backend; every backend has the same call interface"""
+    # Imported here so importing the servers doesn't pull in torch
+    from ultralytics import YOLO
+
+    path = export_model(weights, backend, int8=int8)
+    return YOLO(path, task="detect")
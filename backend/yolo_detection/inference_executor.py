@@ -0,0 +1,57 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from model_registry import registry
+
+# "thread" shares one set of models, "process" gives every worker its own copy
+INFERENCE_EXECUTOR = os.environ.get("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", 2))
+MAX_PENDING_INFERENCES = int(os.environ.get("MAX_PENDING_INFERENCES", INFERENCE_WORKERS))
+
+
+def _init_process_worker():
+    """Load the models once in every worker process"""
+    # A worker process runs one batch at a time, so one Pose instance is enough
+    registry.pose_pool_size = 1
+    registry.load()
+
+
+class InferenceExecutor:
+    """
+    Bounded pool that runs model inference off the asyncio event loop.
+    Each worker thread or process owns its own MediaPipe context through the
+    model registry.
+    """
+
+    def __init__(self, kind=INFERENCE_EXECUTOR, workers=INFERENCE_WORKERS,
+                 max_pending=MAX_PENDING_INFERENCES):
+        if kind == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        elif kind == "process":
+            # spawn, not fork, so workers don't inherit torch/OpenMP thread state
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process_worker,
+            )
+        else:
+            raise ValueError(f"Unknown inference executor: {kind}")
+
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = asyncio.Semaphore(max_pending)
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on the pool and return its result. Waits
+        while max_pending calls are already in flight.
+        """
+        async with self._slots:
+            return await asyncio.wrap_future(self._executor.submit(fn, *args, **kwargs))
+
+    def shutdown(self, wait=False):
+        """Cancel queued calls; with wait, return only once every worker has exited"""
+        self._executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,264 @@
+"""
+Synthetic multi-client load for the live feed server. Every client is a
+real Socket.IO + aiortc peer on this machine that streams a synthetic or
+recorded video and counts the detection results it gets back, so the
+whole server path (signalling, WebRTC decode, inference, emit) is measured.
+
+    python load_generator.py --url http://localhost:5000 --sessions 1 2 4 8 16 --output load.json
+
+Run it on the same machine as the server: result latency is measured
+against the server's captured_at timestamp, which assumes one clock.
+"""
+import argparse
+import asyncio
+import fractions
+import json
+import time
+
+import aiohttp
+import cv2
+import numpy as np
+import socketio
+from aiortc import MediaStreamTrack, RTCPeerConnection, RTCSessionDescription
+from aiortc.contrib.media import MediaBlackhole
+from av import VideoFrame
+
+from inference_backends import list_images
+
+VIDEO_CLOCK_RATE = 90000
+PERCENTILES = (50, 95, 99)
+
+
+def synthetic_frames(width, height, count=60):
+    """Frames with a moving box so the scene gate doesn't skip every frame"""
+    frames = []
+    for i in range(count):
+        img = np.full((height, width, 3), 90, dtype=np.uint8)
+        x = int((width - width // 4) * i / count)
+        cv2.rectangle(img, (x, height // 3), (x + width // 4, height // 3 * 2), (40, 160, 220), -1)
+        frames.append(img)
+    return frames
+
+
+def recorded_frames(frames_dir, width, height, max_frames=300):
+    frames = []
+    for path in list_images(frames_dir)[:max_frames]:
+        img = cv2.imread(path)
+        if img is not None:
+            frames.append(cv2.resize(img, (width, height)))
+    return frames
+
+
+class LoopingVideoTrack(MediaStreamTrack):
+    """Plays a list of BGR frames in a loop at a fixed frame rate"""
+
+    kind = "video"
+
+    def __init__(self, frames, fps):
+        super().__init__()
+        self.frames = [VideoFrame.from_ndarray(img, format="bgr24") for img in frames]
+        self.fps = fps
+        self.index = 0
+        self.start_time = None
+
+    async def recv(self):
+        if self.start_time is None:
+            self.start_time = time.time()
+        target = self.start_time + self.index / self.fps
+        await asyncio.sleep(max(0.0, target - time.time()))
+
+        frame = self.frames[self.index % len(self.frames)]
+        frame.pts = int(self.index * VIDEO_CLOCK_RATE / self.fps)
+        frame.time_base = fractions.Fraction(1, VIDEO_CLOCK_RATE)
+        self.index += 1
+        return frame
+
+
+class LoadClient:
+    """One synthetic user: Socket.IO signalling, a WebRTC video upstream and result counting"""
+
+    def __init__(self, url, frames, fps):
+        self.url = url
+        self.frames = frames
+        self.fps = fps
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.pc = None
+        self.blackhole = MediaBlackhole()
+        self.connected = asyncio.Event()
+        self.measuring = False
+        self.results = 0
+        self.reused = 0
+        # Result age of detector keyframes; predicted results are timed separately
+        self.latencies = []
+        self.prediction_latencies = []
+        self.dropped = {}
+        self.errors = []
+
+        self.sio.on("answer", self.on_answer)
+        self.sio.on("detection-results", self.on_results)
+        self.sio.on("error", self.on_error)
+
+    async def start(self):
+        await self.sio.connect(self.url, transports=["websocket"])
+
+        self.pc = RTCPeerConnection()
+        self.pc.createDataChannel("detections")
+        self.pc.addTrack(LoopingVideoTrack(self.frames, self.fps))
+
+        @self.pc.on("track")
+        def on_track(track):
+            # The server sends the video back; consume it so it doesn't back up
+            self.blackhole.addTrack(track)
+
+        # aiortc gathers ICE candidates before the local description is set
+        await self.pc.setLocalDescription(await self.pc.createOffer())
+        await self.sio.emit("offer", {"sdp": self.pc.localDescription.sdp, "type": self.pc.localDescription.type})
+
+    async def on_answer(self, data):
+        await self.pc.setRemoteDescription(RTCSessionDescription(sdp=data["sdp"], type=data["type"]))
+        await self.blackhole.start()
+        self.connected.set()
+
+    async def on_results(self, data):
+        if not self.measuring:
+            return
+        self.results += 1
+        self.dropped = data.get("dropped", {})
+        if data.get("reused"):
+            self.reused += 1
+        elif data.get("captured_at"):
+            latencies = self.latencies if data.get("keyframe") else self.prediction_latencies
+            latencies.append(time.time() - data["captured_at"])
+
+    async def on_error(self, data):
+        self.errors.append(data.get("message") if isinstance(data, dict) else str(data))
+
+    async def stop(self):
+        await self.blackhole.stop()
+        if self.pc is not None:
+            await self.pc.close()
+        if self.sio.connected:
+            await self.sio.disconnect()
+
+
+async def worker_url(session, url, supervisor):
+    """The URL a client should connect to, asking the supervisor when there is one"""
+    if not supervisor:
+        return url
+    async with session.get(f"{url}/assign") as response:
+        response.raise_for_status()
+        return (await response.json())["url"]
+
+
+def percentiles_ms(samples):
+    if not samples:
+        return None
+    values = np.percentile(np.asarray(samples) * 1000, PERCENTILES)
+    return {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, values)}
+
+
+async def run_level(args, frames, sessions):
+    """Connect sessions clients, measure for args.duration seconds, disconnect them"""
+    clients = []
+    async with aiohttp.ClientSession() as http:
+        for _ in range(sessions):
+            clients.append(LoadClient(await worker_url(http, args.url, args.supervisor), frames, args.fps))
+
+    started = await asyncio.gather(*[client.start() for client in clients], return_exceptions=True)
+    connect_errors = [str(e) for e in started if isinstance(e, Exception)]
+
+    try:
+        waits = [asyncio.wait_for(client.connected.wait(), args.connect_timeout) for client in clients]
+        await asyncio.gather(*waits, return_exceptions=True)
+        live = [client for client in clients if client.connected.is_set()]
+
+        # Let the server warm up to the new sessions before measuring
+        await asyncio.sleep(args.warmup)
+        for client in live:
+            client.measuring = True
+        await asyncio.sleep(args.duration)
+        for client in live:
+            client.measuring = False
+    finally:
+        await asyncio.gather(*[client.stop() for client in clients], return_exceptions=True)
+
+    latencies = [latency for client in live for latency in client.latencies]
+    prediction_latencies = [latency for client in live for latency in client.prediction_latencies]
+    rates = [client.results / args.duration for client in live]
+    latency = percentiles_ms(latencies)
+    min_rate = min(rates) if rates else 0.0
+
+    return {
+        "sessions": sessions,
+        "connected": len(live),
+        "connect_errors": connect_errors,
+        "server_errors": [error for client in clients for error in client.errors],
+        "results_per_second": round(sum(rates), 2),
+        "min_results_per_second_per_session": round(min_rate, 2),
+        "reused_results": sum(client.reused for client in live),
+        "latency_ms": latency,
+        "prediction_latency_ms": percentiles_ms(prediction_latencies),
+        "dropped_frames": sum(client.dropped.get("frames", 0) for client in live),
+        "dropped_results": sum(client.dropped.get("results", 0) for client in live),
+        # A level is sustained when every client connected and got fresh enough results often enough
+        "sustained": (
+            len(live) == sessions
+            and latency is not None
+            and latency["p95"] <= args.max_latency_ms
+            and min_rate >= args.min_rate
+        ),
+    }
+
+
+async def run_load(args, frames):
+    report = {"url": args.url, "fps": args.fps, "resolution": args.resolution, "levels": []}
+
+    for sessions in args.sessions:
+        result = await run_level(args, frames, sessions)
+        report["levels"].append(result)
+
+        latency = result["latency_ms"] or {}
+        print(f"x{sessions}: {result['connected']} connected, {result['results_per_second']} results/s, "
+              f"p95 latency {latency.get('p95')} ms, sustained={result['sustained']}")
+
+    sustained = [level["sessions"] for level in report["levels"] if level["sustained"]]
+    report["max_sustained_sessions"] = max(sustained) if sustained else 0
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:5000", help="live feed server or supervisor URL")
+    parser.add_argument("--supervisor", action="store_true", help="ask the supervisor's /assign for a worker per client")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8], help="concurrent clients per level")
+    parser.add_argument("--frames", help="folder of recorded frames to stream instead of a synthetic scene")
+    parser.add_argument("--resolution", default="640x480", help="WIDTHxHEIGHT of the streamed video")
+    parser.add_argument("--fps", type=float, default=15, help="frame rate each client sends")
+    parser.add_argument("--duration", type=float, default=20, help="seconds measured per level")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds before measuring each level")
+    parser.add_argument("--connect-timeout", type=float, default=15)
+    parser.add_argument("--max-latency-ms", type=float, default=500, help="p95 result latency a sustained level must meet")
+    parser.add_argument("--min-rate", type=float, default=2, help="results per second each session must get")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    if args.frames:
+        frames = recorded_frames(args.frames, width, height)
+    else:
+        frames = synthetic_frames(width, height)
+    if not frames:
+        raise SystemExit("No frames could be read")
+
+    report = asyncio.run(run_load(args, frames))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
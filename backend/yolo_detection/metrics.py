@@ -0,0 +1,211 @@
+import bisect
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; pipeline stages range from sub-millisecond to a slow inference
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def lines(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {value}"
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and two additions"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._counts = {}
+        self._sums = defaultdict(float)
+        self._lock = threading.Lock()
+        # Callables given every raw (value, labels), e.g. for benchmark percentiles
+        self.listeners = []
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self._sums[key] += value
+
+        for listener in self.listeners:
+            listener(value, labels)
+
+    def lines(self):
+        with self._lock:
+            series = [(key, list(counts), self._sums[key]) for key, counts in self._counts.items()]
+
+        for key, counts, total in series:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_format_labels({**labels, 'le': le})} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {total}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+class MetricsRegistry:
+    """Holds the process's metrics and renders them for a /metrics route"""
+
+    def __init__(self):
+        self.metrics = []
+        # Callables returning (name, kind, help, [(labels, value), ...]) at scrape time
+        self.collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.lines())
+
+        for collector in self.collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def process_age():
+    """Seconds since this process was created (or forked), from /proc; None without /proc"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Field 22, counted past the parenthesized command name: start time in clock ticks since boot
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+
+
+class StartupTimer:
+    """
+    Seconds from process start to each startup phase: port bound, models
+    ready, first result served. Each phase is recorded once. Where there
+    is no /proc, time is counted from when this module was imported.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter() - (process_age() or 0.0)
+        self.marks = {}
+
+    def mark(self, phase):
+        if phase in self.marks:
+            return
+        self.marks[phase] = time.perf_counter() - self.started_at
+        print(f"Startup: {phase} after {self.marks[phase] * 1000:.0f} ms")
+
+    def as_ms(self):
+        return {phase: round(seconds * 1000, 1) for phase, seconds in self.marks.items()}
+
+    def collect(self):
+        samples = [({"phase": phase}, seconds) for phase, seconds in self.marks.items()]
+        return [("auraleyes_startup_seconds", "gauge", "Seconds from process start to each startup phase", samples)]
+
+
+metrics = MetricsRegistry()
+
+startup = StartupTimer()
+metrics.add_collector(startup.collect)
+
+STAGE_SECONDS = metrics.histogram(
+    "auraleyes_stage_seconds", "Time spent in each pipeline stage", ["stage"])
+FRAMES = metrics.counter(
+    "auraleyes_frames_total", "Frames by outcome: received, analyzed, dropped or skipped", ["event"])
+RESULTS = metrics.counter(
+    "auraleyes_results_total", "Detection results by outcome: sent or dropped", ["event"])
+RESULT_BYTES = metrics.counter(
+    "auraleyes_result_bytes_total", "Bytes of compact detection results sent, by encoding and transport",
+    ["encoding", "transport"])
+HAZARD_ALERTS = metrics.counter(
+    "auraleyes_hazard_alerts_total", "Urgent hazards sent on the fast path, at analysis ticks or between them", ["path"])
+HAZARD_MESSAGES = metrics.counter(
+    "auraleyes_hazard_messages_total", "Hazard messages by outcome: sent or dropped for a newer one", ["event"])
+SESSION_EVENTS = metrics.counter(
+    "auraleyes_session_events_total", "Sessions admitted, rejected as busy or closed", ["event"])
+ERRORS = metrics.counter(
+    "auraleyes_errors_total", "Errors by where they happened", ["where"])
+
+
+@contextmanager
+def timed(timings, stage):
+    """Add the time spent in the block to timings[stage]"""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start_time
+
+
+def observe_timings(timings):
+    """Record a {stage: seconds} dict in the stage histogram"""
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
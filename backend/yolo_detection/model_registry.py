@@ -0,0 +1,140 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from inference_backends import INFERENCE_BACKEND, INFERENCE_INT8, load_detector
+
+YOLO_WEIGHTS = os.environ.get("YOLO_WEIGHTS", "yolov8n.pt")
+WARMUP_SIZE = int(os.environ.get("WARMUP_SIZE", 640))
+# Warm MediaPipe Pose instances shared by the threads that run inference
+POSE_POOL_SIZE = int(os.environ.get("POSE_POOL_SIZE", os.environ.get("INFERENCE_WORKERS", 2)))
+
+
+class ModelRegistry:
+    """
+    Loads the detection models once per process, warms them up on a dummy
+    frame and hands out ready handles to the Flask and WebRTC servers.
+    """
+
+    def __init__(self, yolo_weights=YOLO_WEIGHTS, backend=INFERENCE_BACKEND, int8=INFERENCE_INT8,
+                 pose_pool_size=POSE_POOL_SIZE):
+        self.yolo_weights = yolo_weights
+        self.backend = backend
+        self.int8 = int8
+        self.yolo_model = None
+        self.ready = False
+        self.error = None
+        self.load_times = {}
+        self.warmup_times = {}
+        self._load_lock = threading.Lock()
+        self._yolo_lock = threading.Lock()
+        # A MediaPipe graph can't run two frames at once, so each call checks one out.
+        # All are loaded and warmed in load(), so no request builds a cold graph
+        self.pose_pool_size = max(1, pose_pool_size)
+        self._poses = queue.Queue()
+
+    def _load_yolo(self, dummy_frame):
+        if self.yolo_model is not None:
+            return  # Already loaded, e.g. inherited from a pre-forking parent
+
+        start_time = time.perf_counter()
+        self.yolo_model = load_detector(self.yolo_weights, self.backend, self.int8)
+        self.load_times["yolo"] = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        self.yolo_model(dummy_frame, verbose=False)
+        self.warmup_times["yolo"] = time.perf_counter() - start_time
+
+    def load_detector(self):
+        """
+        Load and warm up only YOLO, the largest model. A parent process does
+        this before forking workers so they share its memory copy-on-write;
+        MediaPipe is left to each worker.
+        """
+        with self._load_lock:
+            self._load_yolo(np.zeros((WARMUP_SIZE, WARMUP_SIZE, 3), dtype=np.uint8))
+        return self
+
+    def load(self):
+        """Load and warm up all models. Safe to call more than once."""
+        with self._load_lock:
+            if self.ready:
+                return self
+
+            try:
+                dummy_frame = np.zeros((WARMUP_SIZE, WARMUP_SIZE, 3), dtype=np.uint8)
+                self._load_yolo(dummy_frame)
+
+                load_time = warmup_time = 0.0
+                for _ in range(self.pose_pool_size - self._poses.qsize()):
+                    start_time = time.perf_counter()
+                    pose = self._new_pose()
+                    load_time += time.perf_counter() - start_time
+
+                    start_time = time.perf_counter()
+                    pose.process(dummy_frame)
+                    warmup_time += time.perf_counter() - start_time
+                    self._poses.put(pose)
+                self.load_times["pose"] = load_time
+                self.warmup_times["pose"] = warmup_time
+
+                self.error = None
+                self.ready = True
+                print(f"Models ready: load {self.load_times}, warm-up {self.warmup_times}")
+            except Exception as e:
+                self.error = str(e)
+                print(f"Error loading models: {e}")
+                raise
+
+        return self
+
+    def detect(self, frames, **kwargs):
+        """Run YOLO on a single frame or a list of frames"""
+        # The ultralytics predictor is not safe to call from several threads at once
+        with self._yolo_lock:
+            return self.yolo_model(frames, verbose=False, **kwargs)
+
+    def _new_pose(self):
+        import mediapipe as mp
+
+        # Pose runs on unrelated person crops, so don't track between calls
+        return mp.solutions.pose.Pose(static_image_mode=True, min_detection_confidence=0.5)
+
+    @contextmanager
+    def pose(self):
+        """Check a warm MediaPipe Pose instance out of the pool, waiting if all are in use"""
+        self.load()
+        pose = self._poses.get()
+        try:
+            yield pose
+        finally:
+            self._poses.put(pose)
+
+    def class_names(self):
+        """Detector class names in class-ID order"""
+        self.load()
+        names = self.yolo_model.names
+        if isinstance(names, dict):
+            return [names[i] for i in sorted(names)]
+        return list(names)
+
+    def health(self):
+        """Readiness and load timing, for load balancer health checks"""
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "pid": os.getpid(),
+            "yolo_weights": self.yolo_weights,
+            "backend": self.backend,
+            "int8": self.int8,
+            "load_time_ms": {name: round(t * 1000, 1) for name, t in self.load_times.items()},
+            "warmup_time_ms": {name: round(t * 1000, 1) for name, t in self.warmup_times.items()},
+        }
+
+
+# Process-wide registry shared by every server in this process
+registry = ModelRegistry()
@@ -1,170 +1,168 @@
+import io
 import os
+import threading
 
-from ultralytics import YOLO
 import cv2
-import mediapipe as mp
-import time
-import math
-from flask import Flask, request
+import numpy as np
+from flask import Flask, Request, Response, jsonify, request
 from flask_cors import CORS
 
-app = Flask("aural_eyes_app")
-CORS(app)
-
-@app.route("/detect", methods=['POST'])
-def detect_objects():
-
-    yolo_model = YOLO("yolov8n.pt")
-
-    mp_pose = mp.solutions.pose
-    mp_drawing = mp.solutions.drawing_utils
-
-    # Reference sizes for common objects (cm)
-    reference_sizes = {
-        "person": 170,
-        "chair": 80,
-        "dining table": 75,
-        "couch": 90,
-        "bed": 60,
-        "refrigerator": 180,
-        "tv": 55,
-        "laptop": 35,
-        "cell phone": 15,
-        "book": 25,
-        "bottle": 25,
-    }
-
-    def estimate_distance_from_size(obj_class, bbox_height, frame_height):
-        """
-        Estimate distanes based on object size and comera parameters
-
-        """
-
-        if obj_class not in reference_sizes:
-            return None
-
-        real_height_cm = reference_sizes[obj_class]
-
-        # Simple pinhole camera model approximation
-        # Assuming 60 degree vertical FOV
-        # Would need proper calibration for specific camera and better results
-        focal_length_pix = frame_height / (2 * math.tan(math.radians(30)))
-
-        distance_cm = (real_height_cm * focal_length_pix) / bbox_height
-
-        calib_factor = 0.01 # converts to meters and applies calibration
-        distance_m = distance_cm * calib_factor
-
-        return distance_m
+from detection_pipeline import analyze_frames
+from distance_estimation import load_profile
+from metrics import CONTENT_TYPE, ERRORS, FRAMES, metrics, observe_timings, startup, timed
+from model_registry import registry
 
-    cap = cv2.VideoCapture(0)
-    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+# Upper bounds for a single request
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 32 * 1024 * 1024))
+MAX_BATCH_IMAGES = int(os.environ.get("MAX_BATCH_IMAGES", 16))
 
-    # MediaPipe Posing
-    with mp_pose.Pose(
-        min_detection_confidence=0.5,
-        min_tracking_confidence=0.5) as pose:
 
-        # Performance tracking
-        frame_times = []
+class InMemoryRequest(Request):
+    """Keep uploaded files in memory instead of spooling them to temp files"""
 
-        while cap.isOpened():
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
 
-            start_time = time.time()
 
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            pose_results = pose.process(frame_rgb)
-
-            yolo_results = yolo_model(frame)
-
-            for result in yolo_results:
-                for box in result.boxes:
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    conf = float(box.conf[0]) # confidence score
-                    cls_id = int(box.cls[0])
-                    label = result.names[cls_id]
-
-                    bbox_height = y2 - y1
-
-                    distance = estimate_distance_from_size(label, bbox_height, frame_height)
-
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-                    cv2.putText(frame, f"{label}: {conf:.2f}",
-                                (x1, y1 - 25), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-                    if distance is not None:
-                        cv2.putText(frame, f"Dist: {distance:.2f}m",
-                                    (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-            # display mp pose results if detected
-            if pose_results.pose_landmarks:
-                mp_drawing.draw_landmarks(
-                    frame,
-                    pose_results.pose_landmarks,
-                    mp_pose.POSE_CONNECTIONS
-                )
+app = Flask("aural_eyes_app")
+app.request_class = InMemoryRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+CORS(app)
 
-                if pose_results.pose_landmarks:
 
-                    # get nose landmark
-                    nose = pose_results.pose_landmarks.landmark[mp_pose.PoseLandmark.NOSE]
+def decode_image(buffer):
+    """Decode an encoded image straight from a bytes-like buffer, or None"""
+    # np.frombuffer wraps the upload without copying it
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if data.size == 0:
+        return None
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
 
-                    # use shoulder width as reference
-                    left_shoulder =  pose_results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_SHOULDER]
-                    right_shoulder =  pose_results.pose_landmarks.landmark[mp_pose.PoseLandmark.RIGHT_SHOULDER]
 
-                    if left_shoulder.visibility > 0.5 and right_shoulder.visibility > 0.5:
+def upload_buffer(file_storage):
+    """Return the raw bytes of an uploaded file without copying them"""
+    stream = file_storage.stream
+    if isinstance(stream, io.BytesIO):
+        return stream.getbuffer()
+    return stream.read()
 
-                        shoulder_width_px = abs(left_shoulder.x - right_shoulder.x) * frame_width
 
-                        # average human shoulder width is 40cm
-                        # using pinhole camera mdoel
-                        focal_length_px = frame_width / (2 * math.tan(math.radians(30)))
-                        distance_cm = (40 * focal_length_px) / shoulder_width_px
-                        distance_m = distance_cm / 100
+def read_request_images(field_names, timings):
+    """Decode every image in the request, either multipart files or a raw body"""
+    uploads = []
+    for name in field_names:
+        uploads.extend(request.files.getlist(name))
 
-                        # calibration factor
-                        calibrated_distance = distance_m * 0.8
+    if uploads:
+        buffers = [upload_buffer(upload) for upload in uploads]
+    elif request.mimetype.startswith("image/"):
+        buffers = [request.get_data(cache=False)]
+    else:
+        buffers = []
 
-                        # Display person distance
-                        nose_x = int(nose.x * frame_width)
-                        nose_y = int(nose.y * frame_height)
-                        cv2.putText(frame, f"Person: {calibrated_distance:.2f}m",
-                                    (nose_x, nose_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    images = []
+    for index, buffer in enumerate(buffers):
+        with timed(timings, "decode"):
+            img = decode_image(buffer)
+        if img is None:
+            raise ValueError(f"Image {index} could not be decoded")
+        images.append(img)
 
+    return images
 
-            # calculate FPS
-            end_time = time.time()
-            frame_time = end_time - start_time
-            frame_times.append(frame_time)
 
-            if len(frame_times) > 30:
-                frame_times.pop(0)
+def request_profile():
+    """Camera profile for the "device" form field or query parameter, if any"""
+    device = request.values.get("device")
+    return load_profile(device) if device else load_profile()
 
-            avg_frame_time = sum(frame_times) / len(frame_times)
 
-            fps = 1 / avg_frame_time
+def detection_response(img, detected_objects):
+    return {
+        "detections": detected_objects,
+        "width": int(img.shape[1]),
+        "height": int(img.shape[0]),
+    }
 
-            cv2.putText(frame, f"FPS: {fps:.2f}", (10, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
 
-            cv2.imshow("Object Detection with Distance", frame)
+@app.route("/health", methods=['GET'])
+def health():
+    status = {**registry.health(), "startup_ms": startup.as_ms()}
+    return jsonify(status), 200 if status["ready"] else 503
 
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+@app.route("/metrics", methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), headers={"Content-Type": CONTENT_TYPE})
 
-        cap.release()
-        cv2.destroyAllWindows()
+@app.route("/detect", methods=['POST'])
+def detect_objects():
+    """Detect objects and estimate their distances in a single uploaded image"""
+    timings = {}
+    try:
+        images = read_request_images(["image"], timings)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    if len(images) != 1:
+        return jsonify({"message": "Expected exactly one image in the 'image' field"}), 400
+
+    # Models are loaded once per process; this waits if the background load is still running
+    registry.load()
+
+    try:
+        detected_objects = analyze_frames(images, timings=timings, profiles=[request_profile()])[0]
+    except Exception as e:
+        print(f"Error processing image: {e}")
+        ERRORS.inc(where="detect")
+        return jsonify({"message": "Failed to process image"}), 500
+
+    observe_timings(timings)
+    FRAMES.inc(event="analyzed")
+    startup.mark("first_result")
+
+    return jsonify(detection_response(images[0], detected_objects))
+
+@app.route("/detect/batch", methods=['POST'])
+def detect_objects_batch():
+    """Detect objects in several uploaded images with one batched model call"""
+    timings = {}
+    try:
+        images = read_request_images(["images", "image"], timings)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    if not images:
+        return jsonify({"message": "No images found in the 'images' field"}), 400
+    if len(images) > MAX_BATCH_IMAGES:
+        return jsonify({"message": f"At most {MAX_BATCH_IMAGES} images per batch"}), 413
+
+    registry.load()
+
+    try:
+        results = analyze_frames(images, timings=timings, profiles=[request_profile()] * len(images))
+    except Exception as e:
+        print(f"Error processing batch: {e}")
+        ERRORS.inc(where="detect_batch")
+        return jsonify({"message": "Failed to process images"}), 500
+
+    observe_timings(timings)
+    FRAMES.inc(len(images), event="analyzed")
+
+    return jsonify({
+        "results": [detection_response(img, objs) for img, objs in zip(images, results)]
+    })
+
+
+def load_models():
+    try:
+        registry.load()
+        startup.mark("models_ready")
+    except Exception:
+        pass  # Reported by /health; requests retry the load
 
 
 if __name__ == '__main__':
     port = os.environ.get('PORT', 5000)
+    # Serve /health right away and load the models meanwhile
+    threading.Thread(target=load_models, daemon=True).start()
     app.run(host='0.0.0.0', port=port)
-    # detect_objects()
-
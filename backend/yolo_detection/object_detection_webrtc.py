@@ -1,184 +1,231 @@
 import os
 import asyncio
-import json
-import cv2
-import numpy as np
-from aiortc import MediaStreamTrack, RTCPeerConnection, RTCSessionDescription
-import av
-from ultralytics import YOLO
-import mediapipe as mp
-import math
-import time
+import functools
+import signal
 from aiohttp import web
 import socketio
 
+from batch_scheduler import BatchScheduler
+from distance_estimation import session_profile
+from frame_ring import close_ring, shared_ring
+from inference_executor import InferenceExecutor
+from metrics import CONTENT_TYPE, RESULT_BYTES, metrics, startup
+from model_registry import registry
+from result_encoding import CompactEncoder, negotiate
+from roi_tiling import inference_mode
+from session_manager import SessionManager
+
+# aiortc, av, cv2 and the models are imported and loaded after the port is bound,
+# so health checks are answered (with 503) while a new instance warms up
+
 # Create Socket.io server
 sio = socketio.AsyncServer(cors_allowed_origins='*', async_mode='aiohttp')
 app = web.Application()
 sio.attach(app)
 
-# Load models
-yolo_model = YOLO("yolov8n.pt")
-mp_pose = mp.solutions.pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-
-# Store active peer connections
-active_connections = {}
-
-# Reference sizes for common objects (cm)
-reference_sizes = {
-    "person": 170, "chair": 80, "dining table": 75, "couch": 90,
-    "bed": 60, "refrigerator": 180, "tv": 55, "laptop": 35,
-    "cell phone": 15, "book": 25, "bottle": 25,
-}
+# Runs model inference off the event loop, in micro-batches across sessions
+inference_executor = InferenceExecutor()
+batch_scheduler = BatchScheduler(inference_executor)
 
-def estimate_distance_from_size(obj_class, bbox_height, frame_height):
-    """Estimate distances based on object size and camera parameters"""
-    if obj_class not in reference_sizes:
-        return None
+# Shared load slot when running as one of the supervisor's worker processes
+worker_status = None
 
-    real_height_cm = reference_sizes[obj_class]
-    focal_length_pix = frame_height / (2 * math.tan(math.radians(30)))
-    distance_cm = (real_height_cm * focal_length_pix) / bbox_height
-    calib_factor = 0.01  # converts to meters and applies calibration
-    distance_m = distance_cm * calib_factor
+def report_load():
+    """Publish this worker's session count to the supervisor, if any"""
+    if worker_status is not None:
+        worker_status.update(sessions=len(active_connections), ready=registry.ready)
 
-    return distance_m
+async def end_session(sid):
+    """The peer connection is gone; drop the Socket.IO session too so the client reconnects"""
+    await sio.disconnect(sid)
 
-class VideoTransformTrack(MediaStreamTrack):
-    """
-    A video stream track that transforms frames from another track.
-    """
+# Admits, tracks and tears down sessions as their connections come and go
+session_manager = SessionManager(on_change=report_load, on_peer_lost=end_session)
 
-    kind = "video"
-
-    def __init__(self, track, sid):
-        super().__init__()
-        self.track = track
-        self.sid = sid
-        self.frame_count = 0
-        self.frame_times = []
-        self.last_sent_time = 0
-
-    async def recv(self):
-        frame = await self.track.recv()
-
-        # Convert frame to CV2 format
-        img = frame.to_ndarray(format="bgr24")
-        frame_height, frame_width = img.shape[0], img.shape[1]
-
-        current_time = time.time()
-        # Only process every N frames to maintain performance
-        # or process at most X times per second
-        if current_time - self.last_sent_time >= 0.2:  # 5 times per second
-            try:
-                # Process with YOLO
-                yolo_results = yolo_model(img)
-                detected_objects = []
-
-                for result in yolo_results:
-                    for box in result.boxes:
-                        x1, y1, x2, y2 = map(int, box.xyxy[0])
-                        conf = float(box.conf[0])
-                        cls_id = int(box.cls[0])
-                        label = result.names[cls_id]
-
-                        if conf < 0.4:  # Filter out low confidence detections
-                            continue
-
-                        bbox_height = y2 - y1
-                        distance = estimate_distance_from_size(label, bbox_height, frame_height)
-
-                        detected_objects.append({
-                            "label": label,
-                            "confidence": float(conf),
-                            "distance": float(distance) if distance else None,
-                            "bbox": [int(x1), int(y1), int(x2), int(y2)]
-                        })
-
-                # Process with MediaPipe Pose
-                img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                pose_results = mp_pose.process(img_rgb)
-                person_data = None
-
-                if pose_results.pose_landmarks:
-                    # Get person distance from shoulder width
-                    nose = pose_results.pose_landmarks.landmark[mp.solutions.pose.PoseLandmark.NOSE]
-                    left_shoulder = pose_results.pose_landmarks.landmark[mp.solutions.pose.PoseLandmark.LEFT_SHOULDER]
-                    right_shoulder = pose_results.pose_landmarks.landmark[mp.solutions.pose.PoseLandmark.RIGHT_SHOULDER]
-
-                    if left_shoulder.visibility > 0.5 and right_shoulder.visibility > 0.5:
-                        shoulder_width_px = abs(left_shoulder.x - right_shoulder.x) * frame_width
-                        focal_length_px = frame_width / (2 * math.tan(math.radians(30)))
-                        distance_cm = (40 * focal_length_px) / shoulder_width_px
-                        distance_m = distance_cm / 100 * 0.8  # Apply calibration factor
-
-                        # Add person data to detections if a person isn't already in the list
-                        person_exists = False
-                        for obj in detected_objects:
-                            if obj["label"] == "person":
-                                person_exists = True
-                                if not obj["distance"] and distance_m:
-                                    obj["distance"] = float(distance_m)
-                                break
-
-                        if not person_exists:
-                            detected_objects.append({
-                                "label": "person",
-                                "confidence": 0.95,
-                                "distance": float(distance_m)
-                            })
-
-                # Calculate FPS
-                self.frame_count += 1
-                self.frame_times.append(time.time())
-
-                # Keep only last 30 frames for FPS calculation
-                if len(self.frame_times) > 31:
-                    self.frame_times.pop(0)
-
-                if len(self.frame_times) > 1:
-                    fps = (len(self.frame_times) - 1) / (self.frame_times[-1] - self.frame_times[0])
-                else:
-                    fps = 0
-
-                # Send results to the client
-                results = {
-                    "detections": detected_objects,
-                    "fps": float(fps)
-                }
-
-                asyncio.ensure_future(sio.emit('detection-results', results, room=self.sid))
-                self.last_sent_time = current_time
-
-            except Exception as e:
-                print(f"Error processing frame: {e}")
-
-        # Return the frame unmodified for streaming
-        # Or you could add annotations if you want to send processed frames back
-        return frame
+# Store active peer connections
+active_connections = session_manager.sessions
+
+async def health(request):
+    """Readiness probe so the load balancer only routes to warm workers"""
+    status = {**registry.health(), "startup_ms": startup.as_ms(), "sessions": session_manager.stats()}
+    return web.json_response(status, status=200 if status["ready"] else 503)
+
+app.router.add_get("/health", health)
+
+async def stats(request):
+    """Per-session frame and result drop counts"""
+    sessions = {}
+    for sid, connection in active_connections.items():
+        processor = connection.get("processor")
+        if processor:
+            sessions[sid] = processor.stats()
+    ring = shared_ring()
+    return web.json_response({
+        "scheduler": batch_scheduler.stats(),
+        "admission": session_manager.stats(),
+        "frame_ring": ring.stats() if ring is not None else None,
+        "sessions": sessions,
+    })
+
+app.router.add_get("/stats", stats)
+
+def collect_session_metrics():
+    """Per-session counters and scheduler gauges, read at scrape time"""
+    frames, results = [], []
+    for sid, connection in list(active_connections.items()):
+        processor = connection.get("processor")
+        if not processor:
+            continue
+        session = processor.stats()
+        for event in ("received", "analyzed", "dropped", "skipped"):
+            frames.append(({"sid": sid, "event": event}, session[f"frames_{event}"]))
+        for event in ("sent", "dropped"):
+            results.append(({"sid": sid, "event": event}, session[f"results_{event}"]))
+
+    scheduler = batch_scheduler.stats()
+    ring = shared_ring()
+    ring_stats = ring.stats() if ring is not None else {"in_use": 0, "fallbacks": 0}
+    return [
+        ("auraleyes_session_frames_total", "counter", "Frames per session by outcome", frames),
+        ("auraleyes_session_results_total", "counter", "Detection results per session by outcome", results),
+        ("auraleyes_sessions", "gauge", "Connected Socket.IO sessions", [({}, len(active_connections))]),
+        ("auraleyes_waiting_sessions", "gauge", "Sessions with a frame waiting for a batch",
+         [({}, scheduler["waiting_sessions"])]),
+        ("auraleyes_batch_latency_seconds", "gauge", "Smoothed inference time per batch",
+         [({}, batch_scheduler.batch_latency or 0)]),
+        ("auraleyes_frame_slots_in_use", "gauge", "Shared frame ring slots holding a waiting or in-flight frame",
+         [({}, ring_stats["in_use"])]),
+        ("auraleyes_frame_slot_fallbacks_total", "counter",
+         "Frames passed as ordinary arrays because no frame slot was free or they didn't fit",
+         [({}, ring_stats["fallbacks"])]),
+    ]
+
+metrics.add_collector(collect_session_metrics)
+
+async def metrics_endpoint(request):
+    """Prometheus metrics"""
+    return web.Response(body=metrics.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+app.router.add_get("/metrics", metrics_endpoint)
+
+def warm_up():
+    """Import the WebRTC stack and load the models; runs in a thread after binding"""
+    import video_track  # noqa: F401  (aiortc, av, cv2)
+
+    registry.load()
+
+def start_warmup(app):
+    """Load in the background so the server answers health checks right away"""
+    async def run():
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, warm_up)
+            startup.mark("models_ready")
+        finally:
+            report_load()
+
+    app["warmup"] = asyncio.ensure_future(run())
+
+async def start_inference(app):
+    batch_scheduler.start()
+
+async def shutdown_inference(app):
+    await session_manager.close_all("server shutting down")
+    await batch_scheduler.stop()
+    # Workers read frames from the ring in place, so it is unlinked only once they have exited
+    await asyncio.get_running_loop().run_in_executor(None, inference_executor.shutdown, True)
+    close_ring()
+
+app.on_startup.append(start_inference)
+app.on_cleanup.append(shutdown_inference)
+
+async def send_results(sid, results):
+    """Deliver one session's results, compact-encoded if it negotiated that"""
+    startup.mark("first_result")
+    connection = active_connections.get(sid, {})
+    encoder = connection.get("encoder")
+    if encoder is None:
+        await sio.emit('detection-results', results, room=sid)
+        return
+
+    # Compact protocol: prefer the data channel the client opened, else Socket.IO
+    channel = connection.get("data_channel")
+    transport = "datachannel" if channel is not None and channel.readyState == "open" else "socketio"
+    if transport != connection.get("transport"):
+        # Messages on two transports can arrive out of order, so restart the deltas
+        encoder.reset()
+        connection["transport"] = transport
+
+    message = encoder.encode(results)
+    if transport == "datachannel":
+        channel.send(message)
+    else:
+        await sio.emit('detection-results-compact', message, room=sid)
+    RESULT_BYTES.inc(len(message), encoding=encoder.encoding, transport=transport)
+
+async def send_hazard(sid, hazards):
+    # Urgent, so always a plain Socket.IO event, never delta-encoded or queued
+    await sio.emit('hazard', hazards, room=sid)
 
 @sio.event
 async def connect(sid, environ, auth):
-    print(f"Client connected: {sid}")
-    active_connections[sid] = {
-        "pc": None
+    session = {
+        "pc": None,
+        # Camera calibration from the client's device model or its own intrinsics
+        "profile": session_profile(auth),
+        # "full" or "tiled" inference, from auth={"inference_mode": ...}
+        "inference_mode": inference_mode(auth),
     }
+    if not session_manager.admit(sid, session):
+        # Refused before any work is done; the client gets a connect_error it can retry elsewhere
+        print(f"Client refused, worker busy: {sid}")
+        raise socketio.exceptions.ConnectionRefusedError({"message": "busy", "retry": True})
+    print(f"Client connected: {sid}")
+
+    # Clients opt in to compact, delta-encoded results with auth={"protocol": "compact"}
+    encoding = negotiate(auth)
+    if encoding:
+        # Class names come from the detector, so wait for warm-up instead of loading on the loop
+        await asyncio.shield(app["warmup"])
+        encoder = CompactEncoder(registry.class_names(), encoding)
+        session["encoder"] = encoder
+        await sio.emit("protocol", encoder.hello(), room=sid)
 
 @sio.event
 async def disconnect(sid):
     print(f"Client disconnected: {sid}")
-    if sid in active_connections:
-        pc = active_connections[sid].get("pc")
-        if pc:
-            await pc.close()
-        del active_connections[sid]
+    await session_manager.close(sid, "client disconnected")
+
+@sio.event
+async def resync(sid, data=None):
+    """The client lost track of the delta stream; send everything next time"""
+    encoder = active_connections.get(sid, {}).get("encoder")
+    if encoder:
+        encoder.reset()
 
 @sio.event
 async def offer(sid, data):
     try:
         print(f"Received offer from {sid}")
+        # Sessions that arrive during warm-up wait for it rather than failing
+        await asyncio.shield(app["warmup"])
+        from aiortc import RTCPeerConnection, RTCSessionDescription
+        from video_track import VideoTransformTrack
+
+        session = active_connections.get(sid)
+        if session is None:
+            return  # Closed while waiting for warm-up
+        if session.get("pc") is not None:
+            # Renegotiating from scratch: drop the old peer and its processing.
+            # Unset first so closing it doesn't read as the session's peer failing
+            old_pc = session.pop("pc")
+            if session.get("processor"):
+                session.pop("processor").stop()
+            await old_pc.close()
+
         pc = RTCPeerConnection()
-        active_connections[sid]["pc"] = pc
+        session["pc"] = pc
+        # Tear the session down the moment the peer connection fails
+        session_manager.watch(sid, pc)
 
         # Set the remote description
         await pc.setRemoteDescription(RTCSessionDescription(sdp=data["sdp"], type=data["type"]))
@@ -187,7 +234,7 @@ async def offer(sid, data):
         @pc.on("datachannel")
         def on_datachannel(channel):
             print(f"Data channel established for {sid}")
-            active_connections[sid]["data_channel"] = channel
+            session["data_channel"] = channel
 
         # Register track callback
         @pc.on("track")
@@ -195,7 +242,12 @@ async def offer(sid, data):
             print(f"Track received from {sid}: {track.kind}")
             if track.kind == "video":
                 # Create video processor track
-                processor = VideoTransformTrack(track, sid)
+                processor = VideoTransformTrack(
+                    track, sid, batch_scheduler,
+                    functools.partial(send_results, sid), functools.partial(send_hazard, sid),
+                    session.get("profile"), session.get("inference_mode"),
+                )
+                session["processor"] = processor
                 pc.addTrack(processor)
 
         # Create answer
@@ -214,8 +266,9 @@ async def offer(sid, data):
 @sio.event
 async def answer(sid, data):
     try:
-        pc = active_connections[sid].get("pc")
+        pc = active_connections.get(sid, {}).get("pc")
         if pc:
+            from aiortc import RTCSessionDescription
             await pc.setRemoteDescription(RTCSessionDescription(sdp=data["sdp"], type=data["type"]))
     except Exception as e:
         print(f"Error handling answer: {e}")
@@ -223,35 +276,50 @@ async def answer(sid, data):
 @sio.event
 async def ice_candidate(sid, data):
     try:
-        pc = active_connections[sid].get("pc")
-        if pc:
-            candidate = RTCIceCandidate(
-                sdpMLineIndex=data.get("sdpMLineIndex", 0),
-                sdpMid=data.get("sdpMid", "0"),
-                candidate=data["candidate"]
-            )
+        pc = active_connections.get(sid, {}).get("pc")
+        sdp = data.get("candidate") or ""
+        if pc and sdp:
+            from aiortc.sdp import candidate_from_sdp
+
+            # Browsers send the SDP attribute line, "candidate:..."
+            candidate = candidate_from_sdp(sdp.split(":", 1)[1] if sdp.startswith("candidate:") else sdp)
+            candidate.sdpMid = data.get("sdpMid", "0")
+            candidate.sdpMLineIndex = data.get("sdpMLineIndex", 0)
             await pc.addIceCandidate(candidate)
     except Exception as e:
         print(f"Error handling ICE candidate: {e}")
 
-async def cleanup_connections():
-    """Periodic task to clean up stale connections"""
-    while True:
-        for sid in list(active_connections.keys()):
-            pc = active_connections[sid].get("pc")
-            if pc and pc.connectionState in ["failed", "closed"]:
-                print(f"Cleaning up connection for {sid}")
-                await pc.close()
-                if sid in active_connections:
-                    del active_connections[sid]
-        await asyncio.sleep(30)  # Check every 30 seconds
+def run_server(port, status=None):
+    """
+    Serve on port, loading models once the port is bound; status is set
+    when run under the supervisor, which only routes to ready workers.
+    """
+    global worker_status
+    worker_status = status
+    report_load()
+
+    try:
+        asyncio.run(serve(port))
+    except KeyboardInterrupt:
+        pass
+
+async def serve(port):
+    """Start the server, then warm up once the port is actually bound; runs until SIGTERM"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, '0.0.0.0', port).start()
+        startup.mark("bound")
+        print(f"Serving on http://0.0.0.0:{port}")
+        start_warmup(app)
+
+        # The supervisor stops its workers with SIGTERM
+        stopping = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)
+        await stopping.wait()
+    finally:
+        await runner.cleanup()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
-
-    # Start periodic cleanup task
-    loop = asyncio.get_event_loop()
-    loop.create_task(cleanup_connections())
-
-    # Start the server
-    web.run_app(app, host='0.0.0.0', port=port)
+    run_server(port)
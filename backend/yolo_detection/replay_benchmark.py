@@ -0,0 +1,223 @@
+"""
+Replay recorded frames through the live feed pipeline (scene gate, tracker,
+adaptive controller, batch scheduler, inference executor) without WebRTC,
+at several session counts and resolutions, and report throughput, latency
+percentiles per stage and peak memory.
+
+    python replay_benchmark.py --video walk.mp4 --sessions 1 2 4 8 --resolutions 640x480 1280x720 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import resource
+import time
+from collections import defaultdict
+
+import av
+import cv2
+import numpy as np
+
+from batch_scheduler import BatchScheduler
+from frame_ring import close_ring
+from inference_backends import list_images
+from inference_executor import InferenceExecutor
+from metrics import STAGE_SECONDS
+from model_registry import registry
+from roi_tiling import INFERENCE_MODE, INFERENCE_MODES
+from session_pipeline import SessionPipeline
+
+PERCENTILES = (50, 95, 99)
+
+
+def load_frames(frames_dir=None, video=None, max_frames=300):
+    """Read up to max_frames BGR frames from a folder of images or a video file"""
+    frames = []
+    if frames_dir:
+        for path in list_images(frames_dir)[:max_frames]:
+            img = cv2.imread(path)
+            if img is not None:
+                frames.append(img)
+    else:
+        capture = cv2.VideoCapture(video)
+        while len(frames) < max_frames:
+            ok, img = capture.read()
+            if not ok:
+                break
+            frames.append(img)
+        capture.release()
+
+    if not frames:
+        raise SystemExit("No frames could be read")
+    return frames
+
+
+def parse_resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def percentiles_ms(samples):
+    if not samples:
+        return None
+    values = np.percentile(np.asarray(samples) * 1000, PERCENTILES)
+    summary = {f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, values)}
+    summary["count"] = len(samples)
+    return summary
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux; it is the peak for the whole run so far
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+async def feed_session(pipeline, frames, fps, duration, offset):
+    """Feed frames to one session at a fixed frame rate, like a camera would"""
+    loop = asyncio.get_running_loop()
+    await asyncio.sleep(offset)
+    start_time = loop.time()
+    index = 0
+    while loop.time() - start_time < duration:
+        pipeline.process(frames[index % len(frames)])
+        index += 1
+        await asyncio.sleep(max(0.0, start_time + index / fps - loop.time()))
+
+
+async def run_level(executor, frames, sessions, fps, duration, adaptive, mode=None):
+    """Run one (resolution, session count) level and summarize it"""
+    stage_samples = defaultdict(list)
+    # Result age of detector keyframes only; predicted results are fresh by construction
+    latencies = []
+    prediction_latencies = []
+    reused = 0
+
+    def record_stage(value, labels):
+        stage_samples[labels.get("stage", "")].append(value)
+
+    async def record_result(payload):
+        nonlocal reused
+        if payload["reused"]:
+            reused += 1
+        elif payload["keyframe"]:
+            latencies.append(time.time() - payload["captured_at"])
+        else:
+            prediction_latencies.append(time.time() - payload["captured_at"])
+
+    STAGE_SECONDS.listeners.append(record_stage)
+    scheduler = BatchScheduler(executor)
+    scheduler.start()
+    pipelines = []
+    try:
+        for i in range(sessions):
+            pipeline = SessionPipeline(f"bench-{i}", scheduler, record_result, mode=mode)
+            pipeline.controller.enabled = adaptive
+            pipelines.append(pipeline)
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*[
+            # Stagger sessions across one frame interval, as real clients would be
+            feed_session(pipeline, frames, fps, duration, offset=i / (fps * sessions))
+            for i, pipeline in enumerate(pipelines)
+        ])
+        # Let the last batches finish
+        await asyncio.sleep(1.0)
+        elapsed = time.perf_counter() - start_time
+    finally:
+        for pipeline in pipelines:
+            pipeline.stop()
+        await scheduler.stop()
+        STAGE_SECONDS.listeners.remove(record_stage)
+
+    stats = [pipeline.stats() for pipeline in pipelines]
+    analyzed = sum(s["frames_analyzed"] for s in stats)
+    return {
+        "sessions": sessions,
+        "seconds": round(elapsed, 2),
+        "frames_received": sum(s["frames_received"] for s in stats),
+        "frames_analyzed": sum(s["frames_analyzed"] for s in stats),
+        "frames_dropped": sum(s["frames_dropped"] for s in stats),
+        "frames_skipped": sum(s["frames_skipped"] for s in stats),
+        "results_sent": sum(s["results_sent"] for s in stats),
+        "results_dropped": sum(s["results_dropped"] for s in stats),
+        "results_reused": reused,
+        "analyzed_fps": round(analyzed / elapsed, 2),
+        "analyzed_fps_per_session": round(analyzed / elapsed / sessions, 2),
+        "latency_ms": percentiles_ms(latencies),
+        "prediction_latency_ms": percentiles_ms(prediction_latencies),
+        "stages_ms": {stage: percentiles_ms(samples) for stage, samples in sorted(stage_samples.items())},
+        "quality_levels": [s["settings"]["level"] for s in stats],
+        "scheduler": scheduler.stats(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def run_benchmark(args, frames):
+    executor = InferenceExecutor()
+    report = {
+        "executor": executor.kind,
+        "workers": executor.workers,
+        "backend": registry.backend,
+        "fps": args.fps,
+        "duration": args.duration,
+        "adaptive": not args.no_adaptive,
+        "inference_mode": args.inference_mode,
+        "source_frames": len(frames),
+        "levels": [],
+    }
+
+    try:
+        for resolution in args.resolutions:
+            width, height = parse_resolution(resolution)
+            # Build the av frames once; the pipeline converts them like WebRTC frames
+            video_frames = [
+                av.VideoFrame.from_ndarray(cv2.resize(img, (width, height)), format="bgr24")
+                for img in frames
+            ]
+            for sessions in args.sessions:
+                result = await run_level(executor, video_frames, sessions, args.fps, args.duration,
+                                         adaptive=not args.no_adaptive, mode=args.inference_mode)
+                result["resolution"] = resolution
+                report["levels"].append(result)
+
+                latency = result["latency_ms"] or {}
+                print(f"{resolution} x{sessions}: {result['analyzed_fps']} analyzed fps, "
+                      f"p95 latency {latency.get('p95')} ms, {result['frames_dropped']} frames dropped, "
+                      f"peak RSS {result['peak_rss_mb']} MB")
+    finally:
+        executor.shutdown(wait=True)
+        close_ring()
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--frames", help="folder of recorded frames")
+    source.add_argument("--video", help="recorded video file")
+    parser.add_argument("--max-frames", type=int, default=300, help="frames to load and loop over")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8], help="concurrent sessions per level")
+    parser.add_argument("--resolutions", nargs="+", default=["640x480", "1280x720"], help="WIDTHxHEIGHT per level")
+    parser.add_argument("--fps", type=float, default=30, help="camera frame rate per session")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per level")
+    parser.add_argument("--no-adaptive", action="store_true", help="keep every session at full quality")
+    parser.add_argument("--inference-mode", choices=INFERENCE_MODES, default=INFERENCE_MODE,
+                        help="full-frame or tiled inference for every session")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames, args.video, args.max_frames)
+    registry.load()
+
+    report = asyncio.run(run_benchmark(args, frames))
+    report["model_load_ms"] = registry.health()["load_time_ms"]
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import json
+import os
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+PROTOCOL_VERSION = 1
+# Send every object again at least this often so a client can recover from a missed message
+COMPACT_KEYFRAME_INTERVAL = int(os.environ.get("COMPACT_KEYFRAME_INTERVAL", 25))
+# Smaller box and distance changes than these are not worth a "moved" entry
+MOVE_THRESHOLD_PX = int(os.environ.get("COMPACT_MOVE_THRESHOLD_PX", 4))
+MOVE_THRESHOLD_CM = int(os.environ.get("COMPACT_MOVE_THRESHOLD_CM", 10))
+
+# One row per object; track_id 0 marks an untracked object valid for one message only
+OBJECT_DTYPE = np.dtype([
+    ("track_id", "<u4"),
+    ("class_id", "<u2"),
+    ("x1", "<u2"),
+    ("y1", "<u2"),
+    ("x2", "<u2"),
+    ("y2", "<u2"),
+    ("distance_cm", "<u2"),  # 65535 when unknown
+    ("confidence", "u1"),  # confidence * 255
+    ("flags", "u1"),
+])
+UNKNOWN_DISTANCE = 0xFFFF
+FLAG_NEW = 1
+FLAG_PREDICTED = 2
+FLAG_HAZARD = 4
+
+ENCODINGS = ("msgpack", "json") if msgpack is not None else ("json",)
+
+
+def negotiate(auth):
+    """
+    Pick the result protocol from the Socket.IO connect auth payload, e.g.
+    {"protocol": "compact", "encoding": "msgpack"}. Returns None for the
+    original JSON payloads, or the compact encoding to use.
+    """
+    if not isinstance(auth, dict) or auth.get("protocol") != "compact":
+        return None
+    requested = auth.get("encoding", "msgpack")
+    return requested if requested in ENCODINGS else "json"
+
+
+class CompactEncoder:
+    """
+    Per-session delta encoder: each message carries only the objects that
+    are new, moved or removed since the last message that went out, as
+    quantized rows with class IDs instead of label strings.
+    """
+
+    def __init__(self, class_names, encoding="msgpack", keyframe_interval=COMPACT_KEYFRAME_INTERVAL):
+        self.encoding = encoding
+        self.classes = list(class_names)
+        self.class_ids = {name: i for i, name in enumerate(self.classes)}
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.sent = {}  # track_id -> last row sent
+        self.last_settings = None
+        self.seq = 0
+        self.force_keyframe = True
+
+    def hello(self):
+        """Sent once at connect: the class table and how to read the rows"""
+        return {
+            "version": PROTOCOL_VERSION,
+            "encoding": self.encoding,
+            "classes": self.classes,
+            "fields": list(OBJECT_DTYPE.names),
+            "row_format": OBJECT_DTYPE.descr,
+            "unknown_distance": UNKNOWN_DISTANCE,
+            "flags": {"new": FLAG_NEW, "predicted": FLAG_PREDICTED, "hazard": FLAG_HAZARD},
+        }
+
+    def reset(self):
+        """Make the next message a keyframe, e.g. when the client asks to resync"""
+        self.force_keyframe = True
+
+    def _class_id(self, label, added):
+        class_id = self.class_ids.get(label)
+        if class_id is None:
+            # Labels outside the table are announced in the message that first uses them
+            class_id = self.class_ids[label] = len(self.classes)
+            self.classes.append(label)
+            added[class_id] = label
+        return class_id
+
+    def _rows(self, detected_objects, added):
+        rows = []
+        for obj in detected_objects:
+            bbox = obj.get("bbox") or (0, 0, 0, 0)
+            distance = obj.get("distance")
+            confidence = min(max(obj.get("confidence") or 0.0, 0.0), 1.0)
+            rows.append((
+                obj.get("track_id") or 0,
+                self._class_id(obj["label"], added),
+                *(min(max(int(v), 0), 0xFFFF) for v in bbox),
+                UNKNOWN_DISTANCE if distance is None else min(int(distance * 100), UNKNOWN_DISTANCE - 1),
+                int(round(confidence * 255)),
+                (FLAG_NEW if obj.get("new") else 0) | (FLAG_PREDICTED if obj.get("predicted") else 0)
+                | (FLAG_HAZARD if obj.get("hazard") else 0),
+            ))
+        return np.array(rows, dtype=OBJECT_DTYPE)
+
+    @staticmethod
+    def _moved(previous, row):
+        box_delta = max(abs(int(previous[f]) - int(row[f])) for f in ("x1", "y1", "x2", "y2"))
+        distance_delta = abs(int(previous["distance_cm"]) - int(row["distance_cm"]))
+        return (box_delta >= MOVE_THRESHOLD_PX or distance_delta >= MOVE_THRESHOLD_CM
+                or previous["class_id"] != row["class_id"] or previous["flags"] != row["flags"])
+
+    def encode(self, results):
+        """Encode a detection-results payload; returns bytes (msgpack) or str (json)"""
+        keyframe = self.force_keyframe or self.seq % self.keyframe_interval == 0
+        self.force_keyframe = False
+        self.seq += 1
+
+        added_classes = {}
+        rows = self._rows(results["detections"], added_classes)
+        current = {}
+
+        new_mask = np.zeros(len(rows), dtype=bool)
+        moved_mask = np.zeros(len(rows), dtype=bool)
+        for i, row in enumerate(rows):
+            track_id = int(row["track_id"])
+            previous = None if keyframe else self.sent.get(track_id)
+            if track_id == 0 or previous is None:
+                new_mask[i] = True
+            elif self._moved(previous, row):
+                moved_mask[i] = True
+
+            if track_id:
+                # Unchanged objects keep the row the client last saw, so slow drift still adds up to a move
+                current[track_id] = previous if previous is not None and not moved_mask[i] else row.copy()
+
+        added, moved = rows[new_mask], rows[moved_mask]
+        removed = [] if keyframe else sorted(set(self.sent) - set(current))
+        self.sent = current
+
+        message = {
+            "seq": self.seq,
+            "key": keyframe,
+            "fps": round(results["fps"], 1),
+            "captured_at": results.get("captured_at"),
+            "reused": results["reused"],
+            "detected": results.get("keyframe", False),
+            "skip_rate": round(results["skip_rate"], 2),
+            "dropped": [results["dropped"]["frames"], results["dropped"]["results"]],
+        }
+        if added_classes:
+            message["classes"] = added_classes
+        if keyframe or results["settings"] != self.last_settings:
+            message["settings"] = results["settings"]
+            self.last_settings = results["settings"]
+
+        if self.encoding == "msgpack":
+            message.update({
+                "add": added.tobytes(),
+                "move": moved.tobytes(),
+                "remove": np.asarray(removed, dtype="<u4").tobytes(),
+            })
+            return msgpack.packb(message, use_bin_type=True)
+
+        # Packed arrays: one list of integers per object, in OBJECT_DTYPE field order
+        message.update({
+            "add": added.tolist(),
+            "move": moved.tolist(),
+            "remove": removed,
+        })
+        return json.dumps(message, separators=(",", ":"))
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import time
+
+from metrics import ERRORS, RESULTS
+
+# Results waiting to go out per session; older ones are dropped first
+MAX_PENDING_RESULTS = int(os.environ.get("MAX_PENDING_RESULTS", 2))
+# A result older than this is worse than no result for the user
+MAX_RESULT_AGE_MS = float(os.environ.get("MAX_RESULT_AGE_MS", 1000))
+
+
+class ResultSender:
+    """
+    Sends one session's results in order over a bounded queue. When the
+    client can't keep up, the oldest queued results are dropped so the
+    newest one always gets through.
+    """
+
+    def __init__(self, send, max_pending=MAX_PENDING_RESULTS, max_age_ms=MAX_RESULT_AGE_MS, events=RESULTS):
+        self.send = send
+        # Counter of sent and dropped payloads
+        self.events = events
+        self.max_age = max_age_ms / 1000
+        self.queue = asyncio.Queue(maxsize=max(1, max_pending))
+        self.sent = 0
+        self.dropped = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        """Cancel a send in progress and drop whatever is still queued"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def put(self, payload, created_at=None):
+        """Queue a payload to send, dropping the oldest one if the queue is full"""
+        if created_at is None:
+            created_at = time.time()
+
+        while self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.events.inc(event="dropped")
+
+        self.queue.put_nowait((created_at, payload))
+
+    async def _run(self):
+        while True:
+            created_at, payload = await self.queue.get()
+
+            if time.time() - created_at > self.max_age:
+                self.dropped += 1
+                self.events.inc(event="dropped")
+                continue
+
+            try:
+                await self.send(payload)
+                self.sent += 1
+                self.events.inc(event="sent")
+            except Exception as e:
+                print(f"Error sending results: {e}")
+                ERRORS.inc(where="send")
@@ -0,0 +1,141 @@
+import os
+
+import numpy as np
+
+from tracker import iou_matrix
+
+# "full" runs the detector on the whole frame; "tiled" runs a cheap low-resolution full-frame
+# pass plus full-resolution tiles where small objects are likely. Sessions can pick one with
+# auth={"inference_mode": ...}
+INFERENCE_MODE = os.environ.get("INFERENCE_MODE", "full")
+# Detector input size of the full-frame pass in tiled mode
+TILED_FULL_FRAME_SIZE = int(os.environ.get("TILED_FULL_FRAME_SIZE", 320))
+# Side of a tile in full-resolution pixels, which is also its detector input size
+ROI_TILE_SIZE = int(os.environ.get("ROI_TILE_SIZE", 416))
+# Most tiles per detector keyframe
+MAX_ROIS = int(os.environ.get("MAX_ROIS", 3))
+# Same-label boxes overlapping more than this across the passes are one object
+TILE_NMS_IOU = float(os.environ.get("TILE_NMS_IOU", 0.5))
+
+INFERENCE_MODES = ("full", "tiled")
+
+# Tiles only pay off when the full-frame pass shrinks the frame at least this much
+MIN_TILE_DOWNSCALE = 1.5
+# Tracked objects shorter than this fraction of the frame height get a tile of their own
+SMALL_OBJECT_FRACTION = 0.15
+# Mean gray-level change (0-255) over a tile's area that counts as motion
+MOTION_THRESHOLD = 8.0
+# A candidate tile overlapping a chosen one more than this adds little
+MAX_TILE_OVERLAP = 0.3
+# Tile detections this close (pixels) to an inner tile edge are likely cut off
+TILE_EDGE_MARGIN = 4
+
+
+def inference_mode(auth):
+    """Inference mode for a Socket.IO session from its connect auth payload"""
+    if isinstance(auth, dict) and auth.get("inference_mode") in INFERENCE_MODES:
+        return auth["inference_mode"]
+    return INFERENCE_MODE
+
+
+def _tile_at(cx, cy, frame_width, frame_height, tile):
+    """x1, y1, x2, y2 of a tile centered as close to (cx, cy) as the frame allows"""
+    width, height = min(tile, frame_width), min(tile, frame_height)
+    x = int(min(max(cx - width / 2, 0), frame_width - width))
+    y = int(min(max(cy - height / 2, 0), frame_height - height))
+    return x, y, x + width, y + height
+
+
+def motion_center(change_map, frame_width, frame_height, tile=ROI_TILE_SIZE):
+    """
+    Frame coordinates of the tile-sized window that changed most in the
+    scene gate's change map, or None if nothing moved enough
+    """
+    if change_map is None or change_map.size == 0:
+        return None
+
+    rows, cols = change_map.shape
+    window_h = min(rows, max(1, round(tile / frame_height * rows)))
+    window_w = min(cols, max(1, round(tile / frame_width * cols)))
+
+    # Change summed over every window position, from an integral image
+    integral = np.pad(change_map.astype(np.float64).cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+    sums = (integral[window_h:, window_w:] - integral[:-window_h, window_w:]
+            - integral[window_h:, :-window_w] + integral[:-window_h, :-window_w])
+    row, col = np.unravel_index(np.argmax(sums), sums.shape)
+    if sums[row, col] / (window_h * window_w) < MOTION_THRESHOLD:
+        return None
+    return (col + window_w / 2) / cols * frame_width, (row + window_h / 2) / rows * frame_height
+
+
+def choose_rois(frame_width, frame_height, full_frame_size, tracked=(), change_map=None,
+                tile=ROI_TILE_SIZE, max_rois=MAX_ROIS):
+    """
+    Pick up to max_rois full-resolution tiles as (x, y, width, height): around
+    small tracked objects, highest priority first, then where the scene
+    moved, then the center of view. Empty when the full-frame pass at
+    full_frame_size already sees the frame at close to full resolution.
+    """
+    if max_rois <= 0 or max(frame_width, frame_height) < full_frame_size * MIN_TILE_DOWNSCALE:
+        return []
+
+    centers = []
+    small = [
+        obj for obj in tracked
+        if obj.get("bbox") and obj["bbox"][3] - obj["bbox"][1] < frame_height * SMALL_OBJECT_FRACTION
+    ]
+    for obj in sorted(small, key=lambda obj: obj.get("priority", 0), reverse=True):
+        x1, y1, x2, y2 = obj["bbox"]
+        centers.append(((x1 + x2) / 2, (y1 + y2) / 2))
+
+    motion = motion_center(change_map, frame_width, frame_height, tile)
+    if motion is not None:
+        centers.append(motion)
+    centers.append((frame_width / 2, frame_height / 2))
+
+    chosen = []
+    for cx, cy in centers:
+        box = np.array([_tile_at(cx, cy, frame_width, frame_height, tile)], dtype=np.float64)
+        if chosen and iou_matrix(box, np.array(chosen, dtype=np.float64)).max() > MAX_TILE_OVERLAP:
+            continue
+        chosen.append(box[0].tolist())
+        if len(chosen) == max_rois:
+            break
+
+    return [(int(x1), int(y1), int(x2 - x1), int(y2 - y1)) for x1, y1, x2, y2 in chosen]
+
+
+def nms(detections, iou_threshold=TILE_NMS_IOU):
+    """Same-label greedy non-maximum suppression, most confident first"""
+    boxed = sorted((obj for obj in detections if obj.get("bbox")), key=lambda obj: obj["confidence"], reverse=True)
+    unboxed = [obj for obj in detections if not obj.get("bbox")]
+    if len(boxed) < 2:
+        return boxed + unboxed
+
+    ious = iou_matrix(*[np.array([obj["bbox"] for obj in boxed], dtype=np.float64)] * 2)
+    labels = np.array([obj["label"] for obj in boxed])
+    keep = []
+    for i in range(len(boxed)):
+        if keep and (ious[i, keep] > iou_threshold)[labels[keep] == labels[i]].any():
+            continue
+        keep.append(i)
+    return [boxed[i] for i in keep] + unboxed
+
+
+def merge_detections(full_frame, tiles, frame_width, frame_height, iou_threshold=TILE_NMS_IOU):
+    """
+    Merge full-frame detections with tile detections, given as
+    (detections, (x, y, width, height)) in tile coordinates, into one
+    full-frame list with cross-tile NMS
+    """
+    candidates = list(full_frame)
+    for detections, (x, y, width, height) in tiles:
+        for obj in detections:
+            x1, y1, x2, y2 = obj["bbox"]
+            # Cut off by an inner tile edge: the full-frame pass sees it whole
+            if ((x > 0 and x1 <= TILE_EDGE_MARGIN) or (y > 0 and y1 <= TILE_EDGE_MARGIN)
+                    or (x + width < frame_width and x2 >= width - TILE_EDGE_MARGIN)
+                    or (y + height < frame_height and y2 >= height - TILE_EDGE_MARGIN)):
+                continue
+            candidates.append(dict(obj, bbox=[x1 + x, y1 + y, x2 + x, y2 + y]))
+    return nms(candidates, iou_threshold)
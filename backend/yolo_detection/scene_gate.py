@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+
+# Side of the grayscale thumbnail frames are compared on
+SCENE_THUMBNAIL_SIZE = int(os.environ.get("SCENE_THUMBNAIL_SIZE", 32))
+# Mean absolute gray-level difference (0-255) that counts as a scene change
+SCENE_CHANGE_THRESHOLD = float(os.environ.get("SCENE_CHANGE_THRESHOLD", 6.0))
+# Re-analyze at least this often even if nothing seems to change
+SCENE_MAX_REUSE_SECONDS = float(os.environ.get("SCENE_MAX_REUSE_SECONDS", 2.0))
+
+
+class SceneChangeGate:
+    """
+    Cheap pre-filter that compares a frame's thumbnail to the one of the
+    last analyzed frame, so unchanged scenes can skip the models.
+    """
+
+    def __init__(self, threshold=SCENE_CHANGE_THRESHOLD, max_reuse_seconds=SCENE_MAX_REUSE_SECONDS):
+        self.threshold = threshold
+        self.max_reuse_seconds = max_reuse_seconds
+        self.reference = None
+        self.reference_time = 0
+        self.last_change = 0.0
+        # Per-pixel thumbnail difference behind last_change, for finding where the scene moved
+        self.change_map = None
+        self.checked = 0
+        self.skipped = 0
+
+    def should_analyze(self, thumbnail, now):
+        """Return True if the scene changed enough since the last analyzed frame"""
+        self.checked += 1
+
+        if self.reference is not None and self.reference.shape == thumbnail.shape:
+            self.change_map = np.abs(thumbnail.astype(np.int16) - self.reference)
+            self.last_change = float(self.change_map.mean())
+            if self.last_change < self.threshold and now - self.reference_time < self.max_reuse_seconds:
+                self.skipped += 1
+                return False
+
+        self.reference = thumbnail
+        self.reference_time = now
+        return True
+
+    @property
+    def skip_rate(self):
+        return self.skipped / self.checked if self.checked else 0.0
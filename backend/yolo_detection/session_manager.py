@@ -0,0 +1,124 @@
+import asyncio
+import os
+
+from metrics import SESSION_EVENTS
+
+# Most sessions one worker serves; further clients are turned away as busy. 0 means no limit
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", 16))
+# A peer connection that stays "disconnected" this long is torn down; failed or closed ones go at once
+DISCONNECT_GRACE_SECONDS = float(os.environ.get("DISCONNECT_GRACE_SECONDS", 5))
+
+
+class SessionManager:
+    """
+    Owns a worker's sessions from admission to teardown. A session is torn
+    down the moment its Socket.IO connection drops or its peer connection
+    fails, which cancels its waiting inference and queued results, rather
+    than whenever a periodic sweep gets to it. Beyond max_sessions new
+    clients are rejected right away, so they can try another worker
+    instead of slowing down everyone already connected.
+    """
+
+    def __init__(self, max_sessions=MAX_SESSIONS, on_change=None, on_peer_lost=None):
+        self.max_sessions = max_sessions
+        # sid -> session dict: pc, processor, profile, encoder, data_channel, ...
+        self.sessions = {}
+        # Called after sessions are added or removed, e.g. to report load
+        self.on_change = on_change
+        # Coroutine function called with the sid when its peer connection is lost
+        self.on_peer_lost = on_peer_lost
+        self._grace_timers = {}
+        self.admitted = 0
+        self.rejected = 0
+        self.closed = 0
+
+    @property
+    def full(self):
+        return self.max_sessions > 0 and len(self.sessions) >= self.max_sessions
+
+    def admit(self, sid, session):
+        """Add a session unless the worker is full; returns whether it was admitted"""
+        if self.full:
+            self.rejected += 1
+            SESSION_EVENTS.inc(event="rejected")
+            return False
+
+        self.sessions[sid] = session
+        self.admitted += 1
+        SESSION_EVENTS.inc(event="admitted")
+        self._changed()
+        return True
+
+    def watch(self, sid, pc):
+        """Tear the session down as soon as its peer connection fails or closes"""
+
+        @pc.on("connectionstatechange")
+        async def on_connectionstatechange():
+            if self.sessions.get(sid, {}).get("pc") is not pc:
+                return  # A replaced or already closed peer connection
+            state = pc.connectionState
+            if state in ("failed", "closed"):
+                await self._lose_peer(sid, f"peer connection {state}")
+            elif state == "disconnected":
+                # Often recovers on its own, e.g. when the phone switches networks
+                self._cancel_grace(sid)
+                self._grace_timers[sid] = asyncio.get_running_loop().call_later(
+                    DISCONNECT_GRACE_SECONDS,
+                    lambda: asyncio.ensure_future(self._lose_peer(sid, "peer connection disconnected")),
+                )
+            elif state == "connected":
+                self._cancel_grace(sid)
+
+    async def _lose_peer(self, sid, reason):
+        if sid not in self.sessions:
+            return
+        await self.close(sid, reason)
+        if self.on_peer_lost is not None:
+            try:
+                await self.on_peer_lost(sid)
+            except Exception as e:
+                print(f"Error ending session {sid}: {e}")
+
+    async def close(self, sid, reason):
+        """Stop a session's processing, drop its queued work and close its peer; safe to repeat"""
+        session = self.sessions.pop(sid, None)
+        if session is None:
+            return
+        self._cancel_grace(sid)
+        print(f"Closing session {sid}: {reason}")
+
+        # Stopping the processor first cancels its waiting inference and queued results
+        processor = session.get("processor")
+        if processor:
+            processor.stop()
+        pc = session.get("pc")
+        if pc:
+            try:
+                await pc.close()
+            except Exception as e:
+                print(f"Error closing peer connection for {sid}: {e}")
+
+        self.closed += 1
+        SESSION_EVENTS.inc(event="closed")
+        self._changed()
+
+    async def close_all(self, reason):
+        await asyncio.gather(*(self.close(sid, reason) for sid in list(self.sessions)))
+
+    def _cancel_grace(self, sid):
+        timer = self._grace_timers.pop(sid, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "closed": self.closed,
+        }
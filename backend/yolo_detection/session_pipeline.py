@@ -0,0 +1,319 @@
+import asyncio
+import time
+from collections import deque
+
+import numpy as np
+
+from adaptive_controller import AdaptiveController, scale_detections
+from distance_estimation import load_profile
+from frame_ring import shared_ring
+from hazard_priority import HAZARD_CHECK_INTERVAL, HazardScorer
+from metrics import ERRORS, FRAMES, HAZARD_ALERTS, HAZARD_MESSAGES, STAGE_SECONDS, timed
+from result_sender import ResultSender
+from roi_tiling import INFERENCE_MODE, ROI_TILE_SIZE, TILED_FULL_FRAME_SIZE, choose_rois, merge_detections
+from scene_gate import SCENE_THUMBNAIL_SIZE, SceneChangeGate
+from tracker import IoUTracker
+
+
+class SessionPipeline:
+    """
+    Per-session frame processing: scene gating, tracking, adaptive quality,
+    batched inference, hazard priority and result delivery.
+    VideoTransformTrack feeds it WebRTC frames; the benchmarks feed it
+    recorded ones. Urgent hazards go to send_hazard right away, skipping
+    the result queue.
+    """
+
+    def __init__(self, sid, scheduler, send, send_hazard=None, profile=None, mode=None):
+        self.sid = sid
+        # Camera calibration used for this session's distances
+        self.profile = profile
+        # "full" or "tiled" (low-resolution full frame plus full-resolution tiles)
+        self.mode = mode or INFERENCE_MODE
+        self.scheduler = scheduler
+        self.send = send
+        self.frame_count = 0
+        self.frame_times = deque(maxlen=31)  # Last 30 frames for FPS calculation
+        self.last_sent_time = 0
+        self.pending_inference = None
+        # Task that delivers the newest keyframe's result once inference is done
+        self.pending_emit = None
+        # Futures of the last keyframe's tiles in tiled mode
+        self.pending_tiles = []
+        # Result tasks still running, cancelled when the session stops
+        self._tasks = set()
+        self.stopped = False
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.scene_gate = SceneChangeGate()
+        self.tracker = IoUTracker()
+        self.controller = AdaptiveController()
+        self.last_detections = None
+        # Time the newest result sent so far describes
+        self.last_result_at = 0
+        self.hazards = HazardScorer()
+        self.frame_width = None
+        self.frame_height = None
+        self.last_hazard_check = 0
+        # Frames are decoded into shared slots instead of new arrays, when enabled
+        self.ring = shared_ring()
+        self.sender = ResultSender(self._send_timed)
+        self.sender.start()
+        # Hazards skip the result queue but get their own, one deep: a client that is slow
+        # to take them gets the newest alert, not a backlog
+        self.hazard_sender = None
+        if send_hazard is not None:
+            self.hazard_sender = ResultSender(send_hazard, max_pending=1, events=HAZARD_MESSAGES)
+            self.hazard_sender.start()
+
+    def process(self, frame):
+        """Handle one decoded av.VideoFrame; never blocks on inference"""
+        if self.stopped:
+            return
+        self.frames_received += 1
+        FRAMES.inc(event="received")
+
+        current_time = time.time()
+        self.frame_width = frame.width
+        self.frame_height = frame.height
+        # Only process at most X times per second, X set by the adaptive controller
+        if current_time - self.last_sent_time >= self.controller.interval:
+            try:
+                self.last_sent_time = current_time
+
+                # Compare a tiny grayscale copy first; unchanged scenes reuse the last result
+                timings = {}
+                with timed(timings, "scene_gate"):
+                    thumbnail = frame.to_ndarray(width=SCENE_THUMBNAIL_SIZE, height=SCENE_THUMBNAIL_SIZE, format="gray")
+                scene_changed = self.last_detections is None or self.scene_gate.should_analyze(thumbnail, current_time)
+
+                # Adapt input size and rate to server load and scene motion
+                self.controller.update(
+                    current_time,
+                    self.scheduler.batch_latency,
+                    self.scheduler.queue_depth,
+                    scene_static=self.scene_gate.last_change < self.scene_gate.threshold,
+                )
+
+                keyframe_pending = self.pending_emit is not None and not self.pending_emit.done()
+
+                if keyframe_pending and self.last_detections is None:
+                    # Nothing to reuse or carry forward until the first keyframe is back
+                    FRAMES.inc(event="skipped")
+                elif not scene_changed:
+                    FRAMES.inc(event="skipped")
+                    # Objects were already announced as new the first time round
+                    reused = self.prioritize([dict(obj, new=False) for obj in self.last_detections], current_time)
+                    self.last_result_at = current_time
+                    self.sender.put(self.build_results(reused, current_time, reused=True))
+                elif not self.tracker.needs_keyframe(current_time, frame.width, frame.height):
+                    # Between detector keyframes, carry the tracked boxes forward
+                    self.last_detections = self.prioritize(self.tracker.predict(current_time), current_time)
+                    self.last_result_at = current_time
+                    self.sender.put(self.build_results(self.last_detections, current_time))
+                else:
+                    # Convert frame to CV2 format, downscaled by libav to the
+                    # detector input size so no full-resolution array is made,
+                    # and written straight into a shared frame slot
+                    # Tiled mode keeps the full-frame pass cheap; tiles cover the detail
+                    imgsz = self.controller.input_size
+                    if self.mode == "tiled":
+                        imgsz = min(imgsz, TILED_FULL_FRAME_SIZE)
+                    width, height = self.controller.target_size(frame.width, frame.height, imgsz)
+                    with timed(timings, "decode"):
+                        img = self.ring.write(frame, width, height) if self.ring is not None else None
+                        if img is None:
+                            img = frame.to_ndarray(format="bgr24", width=width, height=height)
+                    scale = (frame.width / width, frame.height / height)
+
+                    # Queue for YOLO and MediaPipe Pose, batched with other sessions.
+                    # A frame of ours still waiting for a batch is replaced by this one
+                    previous = self.pending_inference
+                    # Sessions with something close ahead get inferred first
+                    future = self.scheduler.submit(self.sid, img, imgsz=imgsz,
+                                                   priority=self.hazards.session_priority,
+                                                   profile=self.profile)
+                    if previous is not None and previous.cancelled():
+                        self.frames_dropped += 1
+                        FRAMES.inc(event="dropped")
+
+                    self.pending_inference = future
+                    self.tracker.start_keyframe()
+                    tiles = self.submit_tiles(frame, timings) if self.mode == "tiled" else []
+                    self.pending_emit = self._spawn(self.emit_results(future, current_time, scale, tiles))
+
+                for stage, seconds in timings.items():
+                    STAGE_SECONDS.observe(seconds, stage=stage)
+
+            except Exception as e:
+                print(f"Error processing frame: {e}")
+                ERRORS.inc(where="recv")
+
+        elif self.hazards.near_field and current_time - self.last_hazard_check >= HAZARD_CHECK_INTERVAL:
+            # Between ticks, follow near-field hazards on their predicted tracks
+            self.last_hazard_check = current_time
+            try:
+                self.prioritize(self.tracker.peek(current_time), current_time, update=False, path="between_ticks")
+            except Exception as e:
+                print(f"Error checking hazards: {e}")
+                ERRORS.inc(where="hazard")
+
+    def submit_tiles(self, frame, timings):
+        """
+        Queue full-resolution tiles of the frame where small objects are
+        likely, next to the full-frame pass; returns [(future, tile)]
+        """
+        # Tiles of an older keyframe still waiting are no use any more
+        for future in self.pending_tiles:
+            future.cancel()
+        self.pending_tiles = []
+
+        rois = choose_rois(frame.width, frame.height, TILED_FULL_FRAME_SIZE,
+                           self.last_detections or [], self.scene_gate.change_map)
+        if not rois:
+            return []
+
+        with timed(timings, "tile_decode"):
+            full = frame.to_ndarray(format="bgr24")
+        profile = self.profile or load_profile()
+
+        tiles = []
+        for index, (x, y, width, height) in enumerate(rois):
+            crop = full[y:y + height, x:x + width]
+            img = self.ring.write_array(crop) if self.ring is not None else None
+            if img is None:
+                img = np.ascontiguousarray(crop)
+            # Distances in a tile use the full frame's focal length and principal point
+            future = self.scheduler.submit(self.sid, img, imgsz=ROI_TILE_SIZE,
+                                           priority=self.hazards.session_priority,
+                                           profile=profile.cropped(x, y, frame.width, frame.height),
+                                           part=f"roi{index}")
+            tiles.append((future, (x, y, width, height)))
+
+        self.pending_tiles = [future for future, _ in tiles]
+        return tiles
+
+    async def merge_tiles(self, detected_objects, tiles):
+        """Add the tiles' detections to the full-frame ones, with cross-tile NMS"""
+        results = await asyncio.gather(*[future for future, _ in tiles], return_exceptions=True)
+        finished = [(objs, roi) for objs, (_, roi) in zip(results, tiles) if not isinstance(objs, BaseException)]
+        start_time = time.perf_counter()
+        merged = merge_detections(detected_objects, finished, self.frame_width, self.frame_height)
+        STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="tile_merge")
+        return merged
+
+    async def emit_results(self, future, captured_at, scale, tiles=()):
+        """Wait for an inference result and queue it for the client"""
+        try:
+            detected_objects = await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                # Replaced by a newer frame
+                for tile_future, _ in tiles:
+                    tile_future.cancel()
+                return
+            raise
+        except Exception as e:
+            print(f"Error processing frame: {e}")
+            ERRORS.inc(where="inference")
+            return
+
+        # Calculate FPS
+        self.frame_count += 1
+        self.frame_times.append(time.time())
+        FRAMES.inc(event="analyzed")
+
+        # Keyframe: back to full-frame coordinates, then associate with
+        # existing tracks for stable IDs. Predictions for later frames may
+        # have gone out while the detector ran; the tracks are carried
+        # forward to the newest of them so boxes never step back in time
+        detected_objects = scale_detections(detected_objects, *scale)
+        if tiles:
+            detected_objects = await self.merge_tiles(detected_objects, tiles)
+        report_at = max(captured_at, self.last_result_at)
+        detected_objects = self.prioritize(
+            self.tracker.update(detected_objects, captured_at, report_at=report_at), report_at)
+        self.last_detections = detected_objects
+        self.last_result_at = report_at
+
+        # Age is measured from capture, so stale results are dropped, not sent
+        self.sender.put(self.build_results(detected_objects, captured_at, keyframe=True), created_at=captured_at)
+
+    def prioritize(self, detected_objects, now, update=True, path="tick"):
+        """Order objects by hazard priority and send urgent ones on the fast path"""
+        scored = self.hazards.prioritize(detected_objects, self.frame_width, now, update)
+        urgent = self.hazards.urgent(scored, now)
+        if urgent and self.hazard_sender is not None:
+            HAZARD_ALERTS.inc(len(urgent), path=path)
+            self.hazard_sender.put({"hazards": urgent, "captured_at": now}, created_at=now)
+        return scored
+
+    def build_results(self, detected_objects, captured_at, reused=False, keyframe=False):
+        """Build the detection-results payload for a frame captured at captured_at"""
+        if len(self.frame_times) > 1:
+            fps = (len(self.frame_times) - 1) / (self.frame_times[-1] - self.frame_times[0])
+        else:
+            fps = 0
+
+        return {
+            "detections": detected_objects,
+            "fps": float(fps),
+            # Server time the analyzed frame arrived, for measuring result age
+            "captured_at": captured_at,
+            # True when the scene hadn't changed and the models were skipped
+            "reused": reused,
+            # True when the detector ran on this frame; other results are reused or predicted
+            "keyframe": keyframe,
+            "skip_rate": self.scene_gate.skip_rate,
+            "settings": self.controller.settings(),
+            "dropped": {
+                "frames": self.frames_dropped,
+                "results": self.sender.dropped,
+            },
+        }
+
+    async def _send_timed(self, results):
+        start_time = time.perf_counter()
+        await self.send(results)
+        STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="emit")
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def stop(self):
+        """Cancel everything the session still has waiting: inference, results and hazard alerts"""
+        if self.stopped:
+            return
+        self.stopped = True
+        self.sender.stop()
+        if self.hazard_sender is not None:
+            self.hazard_sender.stop()
+        self.scheduler.discard(self.sid)
+        if self.pending_inference is not None:
+            # Already in a batch: the batch runs on, but its result is thrown away
+            self.pending_inference.cancel()
+        for future in self.pending_tiles:
+            future.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+
+    def stats(self):
+        return {
+            "frames_received": self.frames_received,
+            "frames_analyzed": self.frame_count,
+            "frames_dropped": self.frames_dropped,
+            "frames_skipped": self.scene_gate.skipped,
+            "results_sent": self.sender.sent,
+            "results_dropped": self.sender.dropped,
+            "hazards_dropped": self.hazard_sender.dropped if self.hazard_sender is not None else 0,
+            "skip_rate": self.scene_gate.skip_rate,
+            "keyframes": self.tracker.keyframes,
+            "tracks": len(self.tracker.tracks),
+            "hazard_priority": self.hazards.session_priority,
+            "camera_profile": self.profile.name if self.profile else None,
+            "inference_mode": self.mode,
+            "settings": self.controller.settings(),
+        }
@@ -0,0 +1,211 @@
+import asyncio
+import gc
+import multiprocessing
+import os
+import sys
+import time
+
+from aiohttp import web
+
+from session_manager import MAX_SESSIONS
+
+# Number of WebRTC worker processes, each with its own model copies
+WEBRTC_WORKERS = int(os.environ.get("WEBRTC_WORKERS", os.cpu_count() or 1))
+# How sessions reach their worker; {host} is the host the client used
+WORKER_URL_TEMPLATE = os.environ.get("WORKER_URL_TEMPLATE", "http://{host}:{port}")
+# An assignment counts towards a worker's load until its session shows up
+ASSIGNMENT_TTL = float(os.environ.get("ASSIGNMENT_TTL", 5))
+# "spawn" starts every worker from scratch; "fork" loads YOLO once in a fork server and
+# forks workers from it, so they start warm and share its weights copy-on-write
+WORKER_START_METHOD = os.environ.get("WORKER_START_METHOD", "spawn")
+
+
+class WorkerStatus:
+    """One worker's slot in the load table shared with the supervisor"""
+
+    def __init__(self, index, sessions, ready):
+        self.index = index
+        self._sessions = sessions
+        self._ready = ready
+
+    def update(self, sessions, ready):
+        self._sessions[self.index] = sessions
+        self._ready[self.index] = int(ready)
+
+
+def warm_parent():
+    """
+    Import the server and load YOLO in the fork server, before it forks
+    any worker (see warm_fork_server.py). torch is kept to one thread
+    here: a forked child can't use a parent's OpenMP pool.
+    """
+    os.environ["OMP_NUM_THREADS"] = "1"
+
+    import object_detection_webrtc  # noqa: F401
+    import video_track  # noqa: F401
+    from model_registry import registry
+
+    registry.load_detector()
+    # Keep the loaded objects out of the collector so its passes don't
+    # write to (and so copy) pages the workers share
+    gc.freeze()
+
+
+def run_worker(index, port, sessions, ready, threads):
+    """Entry point of a worker process"""
+    # Split the cores between workers; must be set before torch is imported
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    if "torch" in sys.modules:
+        # Forked from a warm parent, torch is already imported
+        sys.modules["torch"].set_num_threads(threads)
+
+    import object_detection_webrtc
+
+    print(f"Worker {index} (pid {os.getpid()}) serving on port {port}")
+    object_detection_webrtc.run_server(port, status=WorkerStatus(index, sessions, ready))
+
+
+class Supervisor:
+    """
+    Starts one WebRTC server process per worker and assigns new sessions to
+    the least loaded one. Each worker keeps its own models and
+    active_connections, so sessions are partitioned by process.
+    """
+
+    def __init__(self, port, workers=WEBRTC_WORKERS, start_method=WORKER_START_METHOD):
+        self.port = port
+        self.workers = max(1, workers)
+        self.threads_per_worker = max(1, (os.cpu_count() or 1) // self.workers)
+        if start_method == "fork":
+            # Workers, restarted ones included, are forked from a single-threaded server
+            # process that has the models loaded, never from the supervisor's running loop
+            self.ctx = multiprocessing.get_context("forkserver")
+            self.ctx.set_forkserver_preload(["warm_fork_server"])
+        elif start_method == "spawn":
+            self.ctx = multiprocessing.get_context("spawn")
+        else:
+            raise ValueError(f"Unknown worker start method: {start_method}")
+        self.sessions = self.ctx.Array("i", self.workers)
+        self.ready = self.ctx.Array("i", self.workers)
+        self.processes = [None] * self.workers
+        # (time, worker) of recent assignments that haven't connected yet
+        self.recent_assignments = []
+
+    def worker_port(self, index):
+        return self.port + 1 + index
+
+    def start_worker(self, index):
+        self.sessions[index] = 0
+        self.ready[index] = 0
+        process = self.ctx.Process(
+            target=run_worker,
+            args=(index, self.worker_port(index), self.sessions, self.ready, self.threads_per_worker),
+            # Not a daemon: a worker's INFERENCE_EXECUTOR=process pool starts child processes,
+            # which daemonic processes may not. stop() terminates the workers instead
+            daemon=False,
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(self.workers):
+            self.start_worker(index)
+
+    def stop(self):
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+
+    async def monitor(self):
+        """Restart workers that exit unexpectedly"""
+        while True:
+            for index, process in enumerate(self.processes):
+                if process is not None and not process.is_alive():
+                    print(f"Worker {index} exited with code {process.exitcode}, restarting")
+                    self.start_worker(index)
+            await asyncio.sleep(1)
+
+    def load(self, index):
+        """Sessions on a worker plus the ones just assigned to it"""
+        return self.sessions[index] + sum(1 for _, worker in self.recent_assignments if worker == index)
+
+    def assign(self):
+        """Pick the least loaded ready worker with room for a session, or None if there is none"""
+        now = time.time()
+        self.recent_assignments = [
+            (t, worker) for t, worker in self.recent_assignments if now - t < ASSIGNMENT_TTL
+        ]
+
+        candidates = [
+            index for index in range(self.workers)
+            if self.ready[index] and (MAX_SESSIONS <= 0 or self.load(index) < MAX_SESSIONS)
+        ]
+        if not candidates:
+            return None
+
+        index = min(candidates, key=self.load)
+        self.recent_assignments.append((now, index))
+        return index
+
+    def status(self):
+        return [
+            {
+                "worker": index,
+                "port": self.worker_port(index),
+                "pid": process.pid if process is not None else None,
+                "alive": process is not None and process.is_alive(),
+                "ready": bool(self.ready[index]),
+                "sessions": self.sessions[index],
+            }
+            for index, process in enumerate(self.processes)
+        ]
+
+
+def create_app(supervisor):
+    app = web.Application()
+
+    async def health(request):
+        workers = supervisor.status()
+        ready = any(worker["ready"] for worker in workers)
+        return web.json_response({"ready": ready, "workers": workers}, status=200 if ready else 503)
+
+    async def assign(request):
+        """Tell a new client which worker to open its Socket.IO session on"""
+        index = supervisor.assign()
+        if index is None:
+            if any(supervisor.ready):
+                # Every ready worker is at MAX_SESSIONS; say so now rather than overload one
+                return web.json_response({"message": "busy"}, status=503, headers={"Retry-After": "5"})
+            return web.json_response({"message": "No worker is ready"}, status=503)
+
+        host = request.host.split(":")[0]
+        url = WORKER_URL_TEMPLATE.format(host=host, port=supervisor.worker_port(index))
+        return web.json_response({"worker": index, "url": url})
+
+    async def start_monitor(app):
+        app["monitor"] = asyncio.ensure_future(supervisor.monitor())
+
+    async def stop_workers(app):
+        app["monitor"].cancel()
+        supervisor.stop()
+
+    app.router.add_get("/health", health)
+    app.router.add_get("/assign", assign)
+    app.on_startup.append(start_monitor)
+    app.on_cleanup.append(stop_workers)
+    return app
+
+
+if __name__ == "__main__":
+    port = int(os.environ.get("PORT", 5000))
+
+    supervisor = Supervisor(port)
+    supervisor.start()
+
+    web.run_app(create_app(supervisor), host='0.0.0.0', port=port)
@@ -0,0 +1,114 @@
+"""
+Compare small-object recall and cost of the low-resolution full-frame pass
+alone and of tiled inference against full-resolution inference, on a
+fixed set of high-resolution images.
+
+    python tiled_recall_check.py --images street_1080p/ --output tiled.json
+
+On still images there are no prior tracks or motion, so the low-resolution
+pass's own small detections stand in for the tracks a live session would have.
+"""
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from backend_accuracy_check import agreement, latency_summary
+from detection_pipeline import analyze_frames
+from distance_estimation import load_profile
+from inference_backends import list_images
+from model_registry import registry
+from roi_tiling import (
+    MAX_ROIS, ROI_TILE_SIZE, SMALL_OBJECT_FRACTION, TILED_FULL_FRAME_SIZE, choose_rois, merge_detections,
+)
+
+
+def full_resolution_size(img):
+    """Detector input size that keeps the image at its native resolution"""
+    return (max(img.shape[:2]) + 31) // 32 * 32
+
+
+def analyze_tiled(img, max_rois=MAX_ROIS):
+    """Low-resolution full-frame pass plus full-resolution tiles, merged with cross-tile NMS"""
+    height, width = img.shape[:2]
+    detected_objects = analyze_frames([img], use_pose=False, imgsz=TILED_FULL_FRAME_SIZE)[0]
+
+    rois = choose_rois(width, height, TILED_FULL_FRAME_SIZE, detected_objects, max_rois=max_rois)
+    if not rois:
+        return detected_objects
+
+    profile = load_profile()
+    tiles = [np.ascontiguousarray(img[y:y + h, x:x + w]) for x, y, w, h in rois]
+    profiles = [profile.cropped(x, y, width, height) for x, y, _, _ in rois]
+    results = analyze_frames(tiles, use_pose=False, imgsz=ROI_TILE_SIZE, profiles=profiles)
+    return merge_detections(detected_objects, list(zip(results, rois)), width, height)
+
+
+def as_boxes(detected_objects, frame_height, small_only):
+    """(boxes, labels) for agreement(), optionally only the small objects"""
+    objects = [
+        obj for obj in detected_objects
+        if not small_only or obj["bbox"][3] - obj["bbox"][1] < frame_height * SMALL_OBJECT_FRACTION
+    ]
+    boxes = np.array([obj["bbox"] for obj in objects], dtype=np.float64).reshape(-1, 4)
+    return boxes, np.array([obj["label"] for obj in objects])
+
+
+def run(images, analyze):
+    """Detections per image and per-image latency in seconds"""
+    analyze(images[0])  # warm-up
+
+    detections, latencies = [], []
+    for img in images:
+        start_time = time.perf_counter()
+        detections.append(analyze(img))
+        latencies.append(time.perf_counter() - start_time)
+    return detections, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="folder of high-resolution evaluation images")
+    parser.add_argument("--max-rois", type=int, default=MAX_ROIS, help="most tiles per image")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    images = [img for img in (cv2.imread(path) for path in list_images(args.images)) if img is not None]
+    if not images:
+        print(f"No images found in {args.images}")
+        return
+
+    registry.load()
+    modes = {
+        "full_resolution": lambda img: analyze_frames([img], use_pose=False, imgsz=full_resolution_size(img))[0],
+        "low_resolution": lambda img: analyze_frames([img], use_pose=False, imgsz=TILED_FULL_FRAME_SIZE)[0],
+        "tiled": lambda img: analyze_tiled(img, args.max_rois),
+    }
+    outputs = {name: run(images, analyze) for name, analyze in modes.items()}
+
+    baseline, baseline_latencies = outputs["full_resolution"]
+    report = {"images": len(images)}
+    for name, (detections, latencies) in outputs.items():
+        stats = latency_summary(latencies)
+        stats["cost"] = float(np.mean(latencies) / np.mean(baseline_latencies))
+        for small_only, prefix in ((False, ""), (True, "small_")):
+            scores = agreement(
+                [as_boxes(objs, img.shape[0], small_only) for objs, img in zip(baseline, images)],
+                [as_boxes(objs, img.shape[0], small_only) for objs, img in zip(detections, images)],
+            )
+            stats.update({prefix + key: value for key, value in scores.items()})
+        report[name] = stats
+
+    for name, stats in report.items():
+        if name != "images":
+            print(name, json.dumps({key: round(value, 3) for key, value in stats.items()}))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
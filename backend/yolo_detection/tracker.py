@@ -0,0 +1,216 @@
+import itertools
+import os
+
+import numpy as np
+
+# Run the detector at least every K analysis ticks; track in between
+DETECTOR_KEYFRAME_INTERVAL = int(os.environ.get("DETECTOR_KEYFRAME_INTERVAL", 3))
+# Minimum IoU for a detection to continue an existing track
+TRACK_IOU_THRESHOLD = float(os.environ.get("TRACK_IOU_THRESHOLD", 0.3))
+# Keyframes a track may go unmatched before it is dropped
+TRACK_MAX_MISSES = int(os.environ.get("TRACK_MAX_MISSES", 1))
+# Force a keyframe once any track's confidence falls below this
+TRACK_MIN_CONFIDENCE = float(os.environ.get("TRACK_MIN_CONFIDENCE", 0.35))
+# Per-tick confidence decay while a track is only predicted
+TRACK_CONFIDENCE_DECAY = float(os.environ.get("TRACK_CONFIDENCE_DECAY", 0.85))
+
+# Alpha-beta filter gains for box position and velocity
+POSITION_GAIN = 0.7
+VELOCITY_GAIN = 0.4
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU between two (N, 4) and (M, 4) arrays of x1, y1, x2, y2 boxes"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)))
+
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+class Track:
+    """One object followed across frames with a constant-velocity box model"""
+
+    def __init__(self, track_id, detection, now):
+        self.track_id = track_id
+        self.label = detection["label"]
+        self.bbox = np.array(detection["bbox"], dtype=np.float64)
+        self.velocity = np.zeros(4)
+        self.detection_confidence = detection["confidence"]
+        self.distance = detection.get("distance")
+        self.distance_bbox_height = self.height
+        self.updated_at = now
+        self.ticks_since_update = 0
+        self.hits = 1
+        self.misses = 0
+        self.announced = False
+
+    @property
+    def height(self):
+        return max(self.bbox[3] - self.bbox[1], 1.0)
+
+    def predicted_bbox(self, now):
+        return self.bbox + self.velocity * (now - self.updated_at)
+
+    @property
+    def confidence(self):
+        """Detector confidence decayed by how long the track has been coasting"""
+        confidence = self.detection_confidence * TRACK_CONFIDENCE_DECAY ** self.ticks_since_update
+        # A track without a velocity estimate yet is less trustworthy
+        return confidence if self.hits > 1 else confidence * TRACK_CONFIDENCE_DECAY
+
+    def update(self, detection, now):
+        dt = now - self.updated_at
+        predicted = self.predicted_bbox(now)
+        residual = np.array(detection["bbox"], dtype=np.float64) - predicted
+
+        self.bbox = predicted + POSITION_GAIN * residual
+        if dt > 0:
+            self.velocity = self.velocity + VELOCITY_GAIN * residual / dt
+
+        self.detection_confidence = detection["confidence"]
+        if detection.get("distance") is not None:
+            self.distance = detection["distance"]
+            self.distance_bbox_height = self.height
+        self.updated_at = now
+        self.ticks_since_update = 0
+        self.hits += 1
+        self.misses = 0
+
+    def to_detection(self, now, predicted, announce=True):
+        bbox = self.predicted_bbox(now) if predicted else self.bbox
+        distance = self.distance
+        if distance is not None and predicted:
+            # Apparent height is inversely proportional to distance
+            height = max(bbox[3] - bbox[1], 1.0)
+            distance = distance * self.distance_bbox_height / height
+
+        detection = {
+            "label": self.label,
+            "confidence": float(self.confidence if predicted else self.detection_confidence),
+            "distance": float(distance) if distance is not None else None,
+            "bbox": [int(round(v)) for v in bbox],
+            "track_id": self.track_id,
+            "new": not self.announced,
+            "predicted": predicted,
+        }
+        if announce:
+            self.announced = True
+        return detection
+
+
+class IoUTracker:
+    """
+    Associates detector output across keyframes by IoU, assigns stable track
+    IDs and predicts boxes and distances between keyframes.
+    """
+
+    def __init__(self, keyframe_interval=DETECTOR_KEYFRAME_INTERVAL,
+                 iou_threshold=TRACK_IOU_THRESHOLD, max_misses=TRACK_MAX_MISSES,
+                 min_confidence=TRACK_MIN_CONFIDENCE):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.min_confidence = min_confidence
+        self.tracks = []
+        # Detections without a box can't be tracked, they are passed through
+        self.untracked = []
+        # Analysis ticks since the detector was last given a frame, see start_keyframe()
+        self.ticks_since_keyframe = 0
+        self.keyframes = 0
+        self._ids = itertools.count(1)
+
+    def needs_keyframe(self, now, frame_width, frame_height):
+        """True when the detector should run on this tick instead of tracking"""
+        if self.keyframes == 0 or self.ticks_since_keyframe + 1 >= self.keyframe_interval:
+            return True
+
+        for track in self.tracks:
+            if track.confidence < self.min_confidence:
+                return True
+            x1, y1, x2, y2 = track.predicted_bbox(now)
+            # Tracks leaving the frame need the detector to confirm them
+            if x2 <= 0 or y2 <= 0 or x1 >= frame_width or y1 >= frame_height or x2 <= x1 or y2 <= y1:
+                return True
+
+        return False
+
+    def start_keyframe(self):
+        """
+        Call when a frame goes to the detector. The cadence counts from
+        here rather than from when its result comes back, so a detector
+        slower than one tick still runs every keyframe_interval ticks
+        instead of back to back.
+        """
+        self.ticks_since_keyframe = 0
+
+    def update(self, detected_objects, now, report_at=None):
+        """
+        Match keyframe detections to tracks and return tracked detections.
+        report_at, if later than now, carries the tracks forward to that
+        time, for a result that arrives after newer predictions went out.
+        """
+        self.keyframes += 1
+        report_at = max(now, report_at or now)
+
+        boxed = [obj for obj in detected_objects if obj.get("bbox")]
+        self.untracked = [obj for obj in detected_objects if not obj.get("bbox")]
+
+        track_boxes = np.array([t.predicted_bbox(now) for t in self.tracks]).reshape(-1, 4)
+        detection_boxes = np.array([obj["bbox"] for obj in boxed], dtype=np.float64).reshape(-1, 4)
+        ious = iou_matrix(track_boxes, detection_boxes)
+
+        # Only same-label pairs may match
+        for i, track in enumerate(self.tracks):
+            for j, obj in enumerate(boxed):
+                if obj["label"] != track.label:
+                    ious[i, j] = 0
+
+        # Greedy association, best overlaps first
+        matched_tracks, matched_detections = set(), set()
+        for flat_index in np.argsort(-ious, axis=None):
+            i, j = np.unravel_index(flat_index, ious.shape)
+            if ious[i, j] < self.iou_threshold:
+                break
+            if i in matched_tracks or j in matched_detections:
+                continue
+            self.tracks[i].update(boxed[j], now)
+            matched_tracks.add(i)
+            matched_detections.add(j)
+
+        survivors = []
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.misses += 1
+                track.ticks_since_update += 1
+                if track.misses > self.max_misses:
+                    continue
+            survivors.append(track)
+
+        for j, obj in enumerate(boxed):
+            if j not in matched_detections:
+                survivors.append(Track(next(self._ids), obj, now))
+
+        self.tracks = survivors
+        # Unmatched survivors are still shown, predicted from their last position
+        return [
+            t.to_detection(report_at, predicted=t.misses > 0 or report_at > now) for t in self.tracks
+        ] + [dict(obj) for obj in self.untracked]
+
+    def predict(self, now):
+        """Carry tracks forward to now without running the detector"""
+        self.ticks_since_keyframe += 1
+        for track in self.tracks:
+            track.ticks_since_update += 1
+        return [t.to_detection(now, predicted=True) for t in self.tracks] + [dict(obj) for obj in self.untracked]
+
+    def peek(self, now):
+        """Predicted tracks at now, without counting a tick or announcing anything"""
+        return [t.to_detection(now, predicted=True, announce=False) for t in self.tracks]
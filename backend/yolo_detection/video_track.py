@@ -0,0 +1,36 @@
+from aiortc import MediaStreamTrack
+
+from session_pipeline import SessionPipeline
+
+
+class VideoTransformTrack(MediaStreamTrack):
+    """
+    A video stream track that transforms frames from another track.
+    Kept out of object_detection_webrtc so aiortc, av and cv2 are only
+    imported once the server is up.
+    """
+
+    kind = "video"
+
+    def __init__(self, track, sid, scheduler, send_results, send_hazard=None, profile=None, mode=None):
+        super().__init__()
+        self.track = track
+        self.sid = sid
+        self.pipeline = SessionPipeline(sid, scheduler, send_results, send_hazard, profile, mode)
+
+    async def recv(self):
+        frame = await self.track.recv()
+
+        # Analysis runs in the background; results are emitted when inference finishes
+        self.pipeline.process(frame)
+
+        # Return the frame unmodified for streaming
+        # Or you could add annotations if you want to send processed frames back
+        return frame
+
+    def stop(self):
+        super().stop()
+        self.pipeline.stop()
+
+    def stats(self):
+        return self.pipeline.stats()
@@ -0,0 +1,9 @@
+"""
+Preloaded by the supervisor's fork server with WORKER_START_METHOD=fork.
+The fork server starts before the supervisor's event loop and loads the
+server and YOLO once; every worker, including restarted ones, is forked
+from it warm.
+"""
+from supervisor import warm_parent
+
+warm_parent()